@@ -1,8 +1,17 @@
+import numpy as np
+
 from enum import Enum
 
 _HEAD_FRAMES = 2
 _EYE_FRAMES = 3
 
+# Wall clock equivalents of the frame counts above at the frame rate they
+# were tuned for. Used whenever get_next is given frame timestamps.
+_REFERENCE_FPS = 30.0
+_HEAD_WINDOW = (_HEAD_FRAMES + 1) / _REFERENCE_FPS
+_EYE_WINDOW = (_EYE_FRAMES + 1) / _REFERENCE_FPS
+_EPSILON = 1e-6        # Absorbs float error in timestamp differences.
+
 class HeadAction(Enum):
     LEFT = 0
     RIGHT = 1
@@ -36,77 +45,259 @@ success = {
     HeadAction.ZOOM: ([HeadAction.CENTER], HeadAction.UNZOOM)
 }
 
-h_type = type(HEAD_REST_STATE)
+""" Compiled gesture tables """
+# Every fired action gets an integer code: eye actions keep their value and
+# head actions are offset by _HEAD_BASE. NO_ACTION marks frames where nothing
+# fires.
+_HEAD_BASE = 7
+NO_ACTION = -1
+
+ACTIONS = [None] * (_HEAD_BASE + len(HeadAction))
+for _a in EyeAction:
+    ACTIONS[_a.value] = _a
+for _a in HeadAction:
+    ACTIONS[_HEAD_BASE + _a.value] = _a
+
+
+def encode(action):
+    """Integer code of an EyeAction or HeadAction."""
+    return action.value + (_HEAD_BASE if type(action) == HeadAction else 0)
+
+
+def _compile(state_type):
+    """Transition table of one channel from success.
+
+    Returns:
+        table[prev][now], the code of the action fired when the channel
+        leaves prev for now, or NO_ACTION.
+    """
+    n = len(ACTIONS)
+    table = [[NO_ACTION] * n for _ in range(n)]
+
+    for prev, (req, action) in success.items():
+        if type(prev) != state_type:
+            continue
+        for now in req:
+            table[prev.value][now.value] = encode(action)
+
+    return table
+
+_EYE_NEXT = _compile(EyeAction)
+_HEAD_NEXT = _compile(HeadAction)
+
+_HEAD_REST = HEAD_REST_STATE.value
+_EYE_REST = EYE_REST_STATE.value
+_ZOOM = encode(HeadAction.ZOOM)
+_UNZOOM = encode(HeadAction.UNZOOM)
 
-class ActionHandler():
+
+class GestureMachine():
+    """Table driven gesture state machine over integer classification codes.
+
+    Eye codes are EyeAction values and head codes are HeadAction values. A
+    channel fires when it leaves a state it has held long enough, and the
+    fired action is looked up in the compiled success tables. Head gestures
+    take priority over eye gestures, and eye gestures are only considered
+    while the head rests.
+
+    step() feeds one live frame at a time and batch() runs a whole recorded
+    stream; both continue from, and update, the same state.
+    """
     def __init__(self):
-        self.__awake = False
-        self.__prev_head = HEAD_REST_STATE
-        self.__prev_eye = EYE_REST_STATE
+        self.__prev_head = _HEAD_REST
+        self.__prev_eye = _EYE_REST
 
         self.__eye_count = 0
         self.__head_count = 0
 
-        self.__zoomed = False
-
-        return
-
-    def __consec(self, prev, action, count):
-        if prev != action:
-            a_type = type(action)
+        # Time of the last eye/head reset, only tracked with timestamps.
+        self.__eye_since = None
+        self.__head_since = None
 
-            if count >= (_HEAD_FRAMES if a_type == h_type else _EYE_FRAMES):
-                return True, 0
+        self.__zoomed = False
 
-        return False, count + 1
+    @staticmethod
+    def __held(count, since, timestamp, frames, window):
+        """Whether a state was held long enough to act on.
 
-    def __next_state(self, prev, now):
-        if prev not in success:
-            return False, None
+        Without a timestamp the state must have lasted frames frames; with
+        one it must have lasted window seconds, independent of the frame
+        rate.
+        """
+        if timestamp is None:
+            return count >= frames
 
-        req, action = success[prev]
+        return timestamp - since + _EPSILON >= window
 
-        if now not in req:
-            return False, None
+    def __start(self, timestamp):
+        if timestamp is None:
+            return
 
-        if action == HeadAction.UNZOOM:
+        # Frame counts start one frame before the first frame; mirror it.
+        start = timestamp - 1 / _REFERENCE_FPS
+        if self.__eye_since is None:
+            self.__eye_since = start
+        if self.__head_since is None:
+            self.__head_since = start
 
-            print("UNZOOM", self.__zoomed)
+    def __transition(self, code):
+        if code == _UNZOOM:
             # Don't unzoom if not zoomed.
             if not self.__zoomed:
-                return False, None
-
+                return NO_ACTION
             self.__zoomed = False
 
-        if action == HeadAction.ZOOM:
+        elif code == _ZOOM:
             # Don't zoom twice.
             if self.__zoomed:
-                return False, None
+                return NO_ACTION
             self.__zoomed = True
 
-        return True, action
+        return code
+
+    def step(self, e_code, h_code, timestamp=None):
+        """Feeds one frame's classification codes.
 
-    def get_next(self, e_action, h_action):
+        Args:
+            e_code: EyeAction value of the frame.
+            h_code: HeadAction value of the frame.
+            timestamp: Frame time in seconds, or None to count frames.
+        Returns:
+            Code of the fired action, or NO_ACTION.
+        """
         e_prev, h_prev = self.__prev_eye, self.__prev_head
+        self.__start(timestamp)
 
-        if h_prev == HEAD_REST_STATE:
-            e_consec, e_count = self.__consec(e_prev, e_action, self.__eye_count)
+        e_fire = False
+        if h_prev == _HEAD_REST:
+            e_fire = e_prev != e_code and self.__held(
+                self.__eye_count, self.__eye_since, timestamp,
+                _EYE_FRAMES, _EYE_WINDOW)
+
+            if e_fire:
+                self.__eye_count, self.__eye_since = 0, timestamp
+            else:
+                self.__eye_count += 1
+        else:
+            self.__eye_count, self.__eye_since = 0, timestamp
+
+        h_fire = h_prev != h_code and self.__held(
+            self.__head_count, self.__head_since, timestamp,
+            _HEAD_FRAMES, _HEAD_WINDOW)
+
+        if h_fire:
+            self.__head_count, self.__head_since = 0, timestamp
         else:
-            e_consec, e_count = False, 0
+            self.__head_count += 1
+
+        self.__prev_eye = e_code
+        self.__prev_head = h_code
+
+        if h_fire:
+            self.__eye_count, self.__eye_since = 0, timestamp
+            return self.__transition(_HEAD_NEXT[h_prev][h_code])
+        elif e_fire:
+            self.__head_count, self.__head_since = 0, timestamp
+            return self.__transition(_EYE_NEXT[e_prev][e_code])
+
+        return NO_ACTION
+
+    def batch(self, e_codes, h_codes, timestamps=None):
+        """Runs a recorded stream of classification codes.
+
+        Gives exactly the same result as calling step() on every frame, but
+        only visits the frames where either channel changes state; the
+        counters in between are derived from frame indices.
+
+        Args:
+            e_codes: (F,) EyeAction values.
+            h_codes: (F,) HeadAction values.
+            timestamps: Optional (F,) frame times in seconds.
+        Returns:
+            Frame indices and codes of the fired actions, as integer arrays.
+        """
+        e_codes = np.asarray(e_codes, dtype=np.int64)
+        h_codes = np.asarray(h_codes, dtype=np.int64)
+        n = len(e_codes)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        t = None
+        if timestamps is not None:
+            t = np.asarray(timestamps, dtype=np.float64)
+            self.__start(float(t[0]))
 
-        h_consec, h_count = self.__consec(h_prev, h_action, self.__head_count)
+        e_prev = np.concatenate(([self.__prev_eye], e_codes[:-1]))
+        h_prev = np.concatenate(([self.__prev_head], h_codes[:-1]))
 
-        self.__prev_eye = e_action
-        self.__prev_head = h_action
+        # Eye counters restart on every frame that follows a non-rest head.
+        idx = np.arange(n)
+        last_moved = np.maximum.accumulate(
+            np.where(h_prev != _HEAD_REST, idx, np.iinfo(np.int64).min))
 
-        self.__eye_count = e_count
-        self.__head_count = h_count
+        # A reset at frame r means the counter is 0 after frame r, so frame i
+        # sees i - r - 1. The current counters become virtual earlier resets.
+        e_reset = -self.__eye_count - 1
+        h_reset = -self.__head_count - 1
+        e_since, h_since = self.__eye_since, self.__head_since
 
-        if e_consec and h_consec or (not e_consec and h_consec):
-            self.__eye_count = 0
-            return self.__next_state(h_prev, h_action)
-        elif e_consec:
-            self.__head_count = 0
-            return self.__next_state(e_prev, e_action)
+        fired_at, fired = [], []
+        for i in np.flatnonzero((e_prev != e_codes) | (h_prev != h_codes)):
+            i = int(i)
+            ts = None if t is None else float(t[i])
+            ep, hp = int(e_prev[i]), int(h_prev[i])
+            e, h = int(e_codes[i]), int(h_codes[i])
+
+            if i > 0 and last_moved[i - 1] > e_reset:
+                e_reset = int(last_moved[i - 1])
+                e_since = None if t is None else float(t[e_reset])
+
+            e_fire = hp == _HEAD_REST and ep != e and self.__held(
+                i - e_reset - 1, e_since, ts, _EYE_FRAMES, _EYE_WINDOW)
+            h_fire = hp != h and self.__held(
+                i - h_reset - 1, h_since, ts, _HEAD_FRAMES, _HEAD_WINDOW)
+
+            if h_fire:
+                code = self.__transition(_HEAD_NEXT[hp][h])
+            elif e_fire:
+                code = self.__transition(_EYE_NEXT[ep][e])
+            else:
+                continue
+
+            e_reset, h_reset, e_since, h_since = i, i, ts, ts
+            if code != NO_ACTION:
+                fired_at.append(i)
+                fired.append(code)
+
+        if last_moved[n - 1] > e_reset:
+            e_reset = int(last_moved[n - 1])
+            e_since = None if t is None else float(t[e_reset])
+
+        self.__prev_eye, self.__prev_head = int(e_codes[-1]), int(h_codes[-1])
+        self.__eye_count = n - 1 - e_reset
+        self.__head_count = n - 1 - h_reset
+        self.__eye_since, self.__head_since = e_since, h_since
+
+        return (np.asarray(fired_at, dtype=np.int64),
+                np.asarray(fired, dtype=np.int64))
+
+
+class ActionHandler(GestureMachine):
+    """GestureMachine driven by EyeAction/HeadAction members."""
+    def get_next(self, e_action, h_action, timestamp=None):
+        """Feeds one frame's classifications through the gesture rules.
+
+        Args:
+            e_action: EyeAction of the frame.
+            h_action: HeadAction of the frame.
+            timestamp: Frame time in seconds. When given, gestures are
+                       confirmed over wall clock windows so their meaning does
+                       not depend on the frame rate; otherwise by frame count.
+        Returns:
+            Whether an action fired, and the action.
+        """
+        code = self.step(e_action.value, h_action.value, timestamp)
+        if code == NO_ACTION:
+            return False, None
 
-        return False, None
+        return True, ACTIONS[code]
@@ -0,0 +1,451 @@
+import sys
+import json
+import time
+import argparse
+import statistics
+import tracemalloc
+
+from itertools import islice
+from collections import OrderedDict
+
+import cv2
+import dlib
+import numpy as np
+
+from imutils import face_utils
+
+from head import Head
+from eyes import Eyes
+from utils import resize_frame, FramePreprocessor
+from features import extract_features
+from detection import detect_head, detect_eyes
+from detectors import ScaledDetector, DETECT_SCALES, DETECTORS, \
+    DETECTOR_HOG, make_detector
+from sources import open_source
+from action import ActionHandler
+from buffers import BufferPool
+
+_TOLERANCE = 0.2
+_PERCENTILES = (50, 95, 99)
+_SYNTHETIC_SIZE = (480, 640)
+
+STAGES = ("preprocess", "detect", "predict", "features", "eyes", "head",
+          "classify", "handler")
+
+ap = argparse.ArgumentParser(description="Detection pipeline benchmarks.")
+ap.add_argument("-p", "--shape-predictor", required=False,
+                help="Path to facial landmark predictor")
+ap.add_argument("-i", "--input", required=False,
+                help="Video file or directory of images to benchmark on. "
+                     "Synthetic frames are generated if omitted.")
+ap.add_argument("-n", "--frames", type=int, default=300, required=False,
+                help="Maximum number of frames to load.")
+
+sub = ap.add_subparsers(dest="bench")
+sub.required = True
+
+scale_ap = sub.add_parser("scale", help="Detection time and landmark drift "
+                                        "per detection scale.")
+scale_ap.add_argument("--scales", type=float, nargs="+",
+                      default=list(DETECT_SCALES), required=False,
+                      help="Detection scales to compare.")
+
+detectors_ap = sub.add_parser("detectors", help="Detection time and recall "
+                                                "per detector backend.")
+detectors_ap.add_argument("--detectors", nargs="+", choices=DETECTORS,
+                          default=list(DETECTORS), required=False,
+                          help="Backends to compare.")
+detectors_ap.add_argument("--cascade", required=False,
+                          help="Cascade file for the cascade backends.")
+
+sub.add_parser("preprocess", help="Time and allocations per frame of "
+                                  "resize_frame + cvtColor versus "
+                                  "FramePreprocessor.")
+
+stages_ap = sub.add_parser("stages", help="Per-stage latency percentiles "
+                                          "against a stored baseline.")
+stages_ap.add_argument("--baseline", required=False,
+                       help="JSON baseline to compare against.")
+stages_ap.add_argument("--save-baseline", required=False,
+                       help="Writes the results as a JSON baseline here.")
+stages_ap.add_argument("--tolerance", type=float, default=_TOLERANCE,
+                       required=False,
+                       help="Allowed p50 slowdown per stage as a fraction "
+                            "of the baseline before the run fails.")
+stages_ap.add_argument("--repeat", type=int, default=3, required=False,
+                       help="Passes over the frames.")
+
+allocations_ap = sub.add_parser("allocations", help="Traced allocations per "
+                                                    "frame of every stage.")
+allocations_ap.add_argument("--detect-scale", type=float, default=0.5,
+                            required=False,
+                            help="Detection scale, see main.py.")
+
+
+def load_frames(path, limit):
+    """Loads up to limit frames from a video file or image directory."""
+    source = open_source(path)
+    frames = [f.image for f in islice(source, limit) if f.image is not None]
+    source.release()
+
+    return frames
+
+
+def synthetic_frames(n, seed=0):
+    """Deterministic noisy frames with a roughly face shaped blob."""
+    rng = np.random.default_rng(seed)
+    h, w = _SYNTHETIC_SIZE
+
+    frames = []
+    for i in range(n):
+        frame = rng.integers(90, 140, (h, w, 3), dtype=np.uint8)
+        cx, cy = w // 2 + int(20 * np.sin(i / 10)), h // 2
+
+        cv2.ellipse(frame, (cx, cy), (70, 95), 0, 0, 360, (150, 170, 200), -1)
+        for ex in (cx - 30, cx + 30):
+            cv2.ellipse(frame, (ex, cy - 25), (14, 6), 0, 0, 360,
+                        (40, 40, 40), -1)
+        frames.append(frame)
+
+    return frames
+
+
+def bench_scale(frames, predictor, scales):
+    """Compares detection at each scale against full resolution detection.
+
+    For every scale reports the median detection time, the fraction of
+    reference faces found, the mean landmark drift in pixels and how often the
+    Head/Eyes decisions differ from the full resolution ones.
+    """
+    hog = dlib.get_frontal_face_detector()
+
+    grays, refs = [], []
+    for frame in frames:
+        frame = resize_frame(frame)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        rects = hog(gray, 0)
+        ref = None
+        if rects:
+            shape = face_utils.shape_to_np(predictor(gray, rects[0]))
+            ref = (shape, _decide(shape, frame, gray))
+
+        grays.append((frame, gray))
+        refs.append(ref)
+
+    faces = sum(ref is not None for ref in refs)
+    print("{} frames, {} with a face at full resolution".format(len(frames),
+                                                               faces))
+    print("{:>6} {:>10} {:>8} {:>10} {:>10}".format(
+        "scale", "detect ms", "recall", "drift px", "decisions"))
+
+    for scale in scales:
+        detector = ScaledDetector(hog, scale)
+
+        times, drifts = [], []
+        found, agree = 0, 0
+        for (frame, gray), ref in zip(grays, refs):
+            start = time.perf_counter()
+            rects = detector(gray, 0)
+            times.append(time.perf_counter() - start)
+
+            if ref is None or not rects:
+                continue
+
+            ref_shape, ref_decision = ref
+            shape = face_utils.shape_to_np(predictor(gray, rects[0]))
+
+            found += 1
+            drifts.append(np.linalg.norm(shape - ref_shape, axis=1).mean())
+            agree += _decide(shape, frame, gray) == ref_decision
+
+        print("{:>6} {:>10.2f} {:>8.2f} {:>10.2f} {:>10.2f}".format(
+            scale, 1000 * statistics.median(times),
+            found / faces if faces else 0,
+            statistics.mean(drifts) if drifts else 0,
+            agree / found if found else 0))
+
+
+def bench_detectors(frames, kinds, cascade=None):
+    """Compares detector backends on the same frames.
+
+    Full resolution HOG is the reference. A reference face counts as found
+    when a detected rectangle contains its center, since the cascades frame
+    faces differently from HOG. Extra are detections in frames where HOG
+    found nothing.
+    """
+    grays = [cv2.cvtColor(resize_frame(f), cv2.COLOR_BGR2GRAY)
+             for f in frames]
+
+    hog = make_detector(DETECTOR_HOG)
+    refs = [hog(gray, 0) for gray in grays]
+    faces = sum(len(r) for r in refs)
+
+    print("{} frames, {} faces found by hog".format(len(frames), faces))
+    print("{:>8} {:>10} {:>10} {:>8} {:>6}".format(
+        "detector", "median ms", "p95 ms", "recall", "extra"))
+
+    for kind in kinds:
+        detector = make_detector(kind, cascade)
+
+        times = []
+        found, extra = 0, 0
+        for gray, ref in zip(grays, refs):
+            start = time.perf_counter()
+            rects = detector(gray, 0)
+            times.append(time.perf_counter() - start)
+
+            if not ref:
+                extra += len(rects)
+                continue
+
+            found += sum(any(r.contains(f.center()) for r in rects)
+                         for f in ref)
+
+        print("{:>8} {:>10.2f} {:>10.2f} {:>8.2f} {:>6}".format(
+            kind, 1000 * statistics.median(times),
+            1000 * float(np.percentile(times, 95)),
+            found / faces if faces else 0, extra))
+
+
+def bench_preprocess(frames, repeat=5):
+    """Time and traced allocations per frame for both preprocessing paths.
+
+    Allocation is the traced peak above the memory in use before the call, so
+    it counts every temporary full frame array that is alive at once.
+    """
+    def legacy(frame):
+        frame = resize_frame(frame)
+        return frame, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    print("{:>14} {:>10} {:>16}".format("path", "us/frame", "alloc KB/frame"))
+
+    for name, preprocess in (("resize_frame", legacy),
+                             ("preprocessor", FramePreprocessor())):
+        # Warm up so reusable buffers exist before measuring.
+        preprocess(frames[0])
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for frame in frames:
+                preprocess(frame)
+        elapsed = time.perf_counter() - start
+
+        peaks = []
+        tracemalloc.start()
+        for frame in frames:
+            base, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            preprocess(frame)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - base)
+        tracemalloc.stop()
+
+        print("{:>14} {:>10.1f} {:>16.1f}".format(
+            name, 1e6 * elapsed / (repeat * len(frames)),
+            statistics.mean(peaks) / 1024))
+
+
+def _run_stages(frames, predictor, measure, repeat=1, detect_scale=1.0):
+    """Runs every stage of FrameProcessor separately, each through
+    measure(stage, fn, *args).
+
+    The grayscale conversion is part of the preprocess stage since
+    FramePreprocessor produces both images in one pass. Frames in which no
+    face is detected fall back to a centered rect so the later stages still
+    run on every frame.
+
+    Returns:
+        The buffers.BufferPool the stages shared.
+    """
+    pool = BufferPool()
+    detector = ScaledDetector(dlib.get_frontal_face_detector(), detect_scale,
+                              pool)
+    preprocess = FramePreprocessor(pool)
+    handler = ActionHandler()
+
+    for _ in range(repeat):
+        for frame in frames:
+            image, gray = measure("preprocess", preprocess, frame)
+            h, w, _ = image.shape
+
+            rects = measure("detect", detector, gray, 0)
+            rect = rects[0] if rects else \
+                dlib.rectangle(w // 4, h // 4, 3 * w // 4, 3 * h // 4)
+
+            shape = measure("predict", lambda: face_utils.shape_to_np(
+                predictor(gray, rect)))
+            features = measure("features", extract_features, shape, w)
+
+            cur_eyes = measure("eyes", Eyes, features, gray, None, pool)
+            cur_head = measure("head", Head, features)
+
+            eye_action, head_action = measure("classify", lambda: (
+                detect_eyes(features, cur_eyes),
+                detect_head(features, cur_head)))
+
+            measure("handler", handler.get_next, eye_action, head_action)
+
+    return pool
+
+
+def bench_stages(frames, predictor, repeat=3):
+    """Times every stage of FrameProcessor separately.
+
+    Returns:
+        OrderedDict of stage name to latency samples in seconds.
+    """
+    samples = OrderedDict((stage, []) for stage in STAGES)
+
+    def timed(stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        samples[stage].append(time.perf_counter() - start)
+
+        return result
+
+    pool = _run_stages(frames, predictor, timed, repeat)
+    print("pooled buffer allocations: {}".format(pool.allocations),
+          file=sys.stderr)
+
+    return samples
+
+
+def bench_allocations(frames, predictor, detect_scale=0.5):
+    """Traced allocations per frame of every stage in steady state.
+
+    The first pass over the frames fills the buffer pools. Every stage call
+    of the second pass is measured like bench_preprocess does: the traced
+    peak above the memory in use before the call. Memory dlib allocates
+    inside its C++ code is not traced; the arrays its results are converted
+    to are.
+    """
+    peaks = OrderedDict((stage, []) for stage in STAGES)
+    calls = OrderedDict((stage, 0) for stage in STAGES)
+
+    def traced(stage, fn, *args):
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+
+        calls[stage] += 1
+        if calls[stage] > len(frames):
+            peaks[stage].append(peak - base)
+
+        return result
+
+    tracemalloc.start()
+    _run_stages(frames, predictor, traced, 2, detect_scale)
+    tracemalloc.stop()
+
+    print("{:>10} {:>16} {:>16}".format("stage", "alloc KB/frame",
+                                        "max KB/frame"))
+    for stage, sizes in peaks.items():
+        print("{:>10} {:>16.1f} {:>16.1f}".format(
+            stage, statistics.mean(sizes) / 1024, max(sizes) / 1024))
+
+
+def summarize(samples):
+    """p50/p95/p99 in milliseconds and frames per second for every stage."""
+    summary = OrderedDict()
+    for stage, times in samples.items():
+        times = np.asarray(times)
+        p = np.percentile(times, _PERCENTILES) * 1000
+
+        summary[stage] = OrderedDict(
+            [("p{}".format(q), round(float(v), 4))
+             for q, v in zip(_PERCENTILES, p)] +
+            [("fps", round(float(1 / times.mean()), 1))])
+
+    return summary
+
+
+def compare(summary, baseline, tolerance):
+    """Stages whose p50 regressed past tolerance.
+
+    Returns:
+        List of (stage, baseline p50, current p50).
+    """
+    regressions = []
+    for stage, stats in summary.items():
+        if stage not in baseline:
+            continue
+
+        before, now = baseline[stage]["p50"], stats["p50"]
+        if now > before * (1 + tolerance):
+            regressions.append((stage, before, now))
+
+    return regressions
+
+
+def print_summary(summary):
+    print("{:>10} {:>9} {:>9} {:>9} {:>10}".format(
+        "stage", "p50 ms", "p95 ms", "p99 ms", "fps"))
+    for stage, stats in summary.items():
+        print("{:>10} {:>9.3f} {:>9.3f} {:>9.3f} {:>10.1f}".format(
+            stage, stats["p50"], stats["p95"], stats["p99"], stats["fps"]))
+
+
+def _decide(shape, frame, gray):
+    _, w, _ = frame.shape
+    features = extract_features(shape, w)
+
+    return (detect_head(features, Head(features)),
+            detect_eyes(features, Eyes(features, gray)))
+
+
+def main():
+    args = vars(ap.parse_args())
+
+    if args["input"] is None:
+        frames = synthetic_frames(args["frames"])
+    else:
+        frames = load_frames(args["input"], args["frames"])
+
+    if not frames:
+        ap.error("No frames could be read from {}".format(args["input"]))
+
+    if args["bench"] == "preprocess":
+        bench_preprocess(frames)
+        return
+
+    if args["bench"] == "detectors":
+        bench_detectors(frames, args["detectors"], args["cascade"])
+        return
+
+    if args["shape_predictor"] is None:
+        ap.error("--shape-predictor is required for the {} benchmark"
+                 .format(args["bench"]))
+
+    predictor = dlib.shape_predictor(args["shape_predictor"])
+
+    if args["bench"] == "scale":
+        bench_scale(frames, predictor, args["scales"])
+        return
+
+    if args["bench"] == "allocations":
+        bench_allocations(frames, predictor, args["detect_scale"])
+        return
+
+    summary = summarize(bench_stages(frames, predictor, args["repeat"]))
+    print_summary(summary)
+
+    if args["save_baseline"]:
+        with open(args["save_baseline"], "w") as f:
+            json.dump({"frames": len(frames), "stages": summary}, f, indent=2)
+
+    if args["baseline"]:
+        with open(args["baseline"]) as f:
+            baseline = json.load(f)["stages"]
+
+        regressions = compare(summary, baseline, args["tolerance"])
+        for stage, before, now in regressions:
+            print("REGRESSION {}: p50 {:.3f} ms -> {:.3f} ms".format(
+                stage, before, now))
+
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import os
+import stat
+import errno
+import time
+import socket
+import struct
+import argparse
+import selectors
+import threading
+
+from collections import deque, namedtuple
+
+from action import HeadAction, EyeAction, ACTIONS, NO_ACTION, encode
+
+MSG_ACTION = 1      # An action fired.
+MSG_FRAME = 2       # Raw per frame classification, only with raw set.
+MSG_PING = 3        # Server to subscriber, echoed back as MSG_PONG.
+MSG_PONG = 4
+
+# kind, face id, action code (NO_ACTION if none), head, eye, frame index,
+# frame timestamp, server send time on the monotonic clock.
+_MESSAGE = struct.Struct("<BBbBBxxxIdd")
+
+_QUEUE_SIZE = 64
+_PING_INTERVAL = 1.0
+_RTT_WINDOW = 256
+
+Message = namedtuple("Message", [
+    "kind", "face_id", "action", "head_action", "eye_action", "index",
+    "timestamp",
+    "latency",      # Seconds from publish to receipt.
+])
+
+ap = argparse.ArgumentParser(description="Prints the actions broadcast by "
+                                         "main.py --serve.")
+ap.add_argument("-s", "--socket", required=True,
+                help="UNIX socket the capture daemon serves on.")
+
+
+class _Subscriber():
+    def __init__(self, sock, size):
+        self.sock = sock
+        self.outbox = deque(maxlen=size)
+        self.pending = b""
+        self.inbox = b""
+        self.dropped = 0
+
+
+def _serving(path):
+    """Whether something accepts connections on the UNIX socket at path."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+
+    return True
+
+
+class ActionBroadcaster(threading.Thread):
+    """Publishes stream events to any number of local subscribers.
+
+    Every message is one fixed size _MESSAGE frame. Each subscriber has its
+    own bounded outbox: a subscriber that reads too slowly loses its oldest
+    messages, and never holds up the capture loop or the other subscribers.
+    The server pings every subscriber once per ping_interval to keep round
+    trip latency statistics.
+
+    Args:
+        path: UNIX socket path. A stale socket at path is replaced; one that
+              another daemon still serves raises OSError (EADDRINUSE).
+        raw: Also publishes the classification of frames without an action.
+        size: Outbox size per subscriber.
+    """
+    def __init__(self, path, raw=False, size=_QUEUE_SIZE,
+                 ping_interval=_PING_INTERVAL):
+        super().__init__(name="action-broadcaster", daemon=True)
+
+        self.__path = path
+        self.__raw = raw
+        self.__size = size
+        self.__ping_interval = ping_interval
+
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            if _serving(path):
+                raise OSError(errno.EADDRINUSE,
+                              "Another daemon is serving on", path)
+            os.unlink(path)
+
+        self.__server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__server.bind(path)
+        self.__server.listen()
+        self.__server.setblocking(False)
+
+        self.__wake_r, self.__wake_w = socket.socketpair()
+        self.__wake_r.setblocking(False)
+        self.__wake_w.setblocking(False)
+
+        self.__lock = threading.Lock()
+        self.__subscribers = {}
+        self.__stop = threading.Event()
+        self.__rtts = deque(maxlen=_RTT_WINDOW)
+
+        self.sent = 0
+        self.dropped = 0
+
+    def publish(self, event):
+        """Queues a capture.StreamEvent for every subscriber."""
+        if event.action is None and not self.__raw:
+            return
+
+        kind = MSG_FRAME if event.action is None else MSG_ACTION
+        code = NO_ACTION if event.action is None else encode(event.action)
+
+        self.__broadcast(_MESSAGE.pack(
+            kind, event.face_id & 0xFF, code, event.head_action.value,
+            event.eye_action.value, event.index & 0xFFFFFFFF,
+            event.timestamp, time.monotonic()))
+
+    def __broadcast(self, msg):
+        with self.__lock:
+            for sub in self.__subscribers.values():
+                if len(sub.outbox) == sub.outbox.maxlen:
+                    sub.dropped += 1
+                    self.dropped += 1
+                sub.outbox.append(msg)
+
+        try:
+            self.__wake_w.send(b"\0")
+        except BlockingIOError:
+            pass    # Already woken.
+
+    def run(self):
+        sel = selectors.DefaultSelector()
+        sel.register(self.__server, selectors.EVENT_READ)
+        sel.register(self.__wake_r, selectors.EVENT_READ)
+
+        next_ping = time.monotonic() + self.__ping_interval
+        while not self.__stop.is_set():
+            timeout = max(0, next_ping - time.monotonic())
+
+            for key, events in sel.select(timeout):
+                if key.fileobj is self.__server:
+                    self.__accept(sel)
+                elif key.fileobj is self.__wake_r:
+                    self.__drain_wake()
+                elif events & selectors.EVENT_READ:
+                    self.__receive(sel, key.data)
+
+            if time.monotonic() >= next_ping:
+                self.__broadcast(_MESSAGE.pack(MSG_PING, 0, NO_ACTION, 0, 0,
+                                               0, 0.0, time.monotonic()))
+                next_ping += self.__ping_interval
+
+            for sub in list(self.__subscribers.values()):
+                self.__flush(sel, sub)
+
+        for sub in list(self.__subscribers.values()):
+            self.__remove(sel, sub)
+        sel.close()
+
+    def __accept(self, sel):
+        try:
+            sock, _ = self.__server.accept()
+        except BlockingIOError:
+            return
+
+        sock.setblocking(False)
+        sub = _Subscriber(sock, self.__size)
+        with self.__lock:
+            self.__subscribers[sock] = sub
+        sel.register(sock, selectors.EVENT_READ, sub)
+
+    def __drain_wake(self):
+        try:
+            while self.__wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def __remove(self, sel, sub):
+        with self.__lock:
+            self.__subscribers.pop(sub.sock, None)
+        sel.unregister(sub.sock)
+        sub.sock.close()
+
+    def __receive(self, sel, sub):
+        try:
+            data = sub.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        if not data:
+            self.__remove(sel, sub)
+            return
+
+        sub.inbox += data
+        now = time.monotonic()
+        while len(sub.inbox) >= _MESSAGE.size:
+            msg = _MESSAGE.unpack_from(sub.inbox)
+            sub.inbox = sub.inbox[_MESSAGE.size:]
+
+            if msg[0] == MSG_PONG:
+                self.__rtts.append(now - msg[-1])
+
+    def __flush(self, sel, sub):
+        while sub.pending or sub.outbox:
+            if not sub.pending:
+                sub.pending = sub.outbox.popleft()
+
+            try:
+                n = sub.sock.send(sub.pending)
+            except BlockingIOError:
+                break
+            except OSError:
+                self.__remove(sel, sub)
+                return
+
+            sub.pending = sub.pending[n:]
+            if not sub.pending:
+                self.sent += 1
+
+        # Wake up when a blocked subscriber can take more.
+        events = selectors.EVENT_READ
+        if sub.pending:
+            events |= selectors.EVENT_WRITE
+        sel.modify(sub.sock, events, sub)
+
+    def stats(self):
+        """Subscriber count, message counters and round trip times in ms."""
+        rtts = sorted(self.__rtts)
+        pick = lambda q: round(1000 * rtts[int(q * (len(rtts) - 1))], 3) \
+            if rtts else None
+
+        return {
+            "subscribers": len(self.__subscribers),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "rtt_p50_ms": pick(0.5),
+            "rtt_p95_ms": pick(0.95),
+            "rtt_max_ms": pick(1.0),
+        }
+
+    def stop(self):
+        self.__stop.set()
+        self.__wake_w.send(b"\0")
+        self.join()
+
+        self.__server.close()
+        self.__wake_r.close()
+        self.__wake_w.close()
+        os.unlink(self.__path)
+
+
+def subscribe(path):
+    """Connects to an ActionBroadcaster and answers its pings.
+
+    Yields:
+        Message for every action (and raw frame, if the server sends them)
+        until the server goes away.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+
+    buf = b""
+    try:
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                return
+
+            buf += data
+            now = time.monotonic()
+            while len(buf) >= _MESSAGE.size:
+                msg = _MESSAGE.unpack_from(buf)
+                buf = buf[_MESSAGE.size:]
+
+                kind, face_id, code, head, eye, index, timestamp, sent = msg
+                if kind == MSG_PING:
+                    sock.sendall(_MESSAGE.pack(MSG_PONG, *msg[1:]))
+                    continue
+
+                action = ACTIONS[code] if code != NO_ACTION else None
+                yield Message(kind, face_id, action, HeadAction(head),
+                              EyeAction(eye), index, timestamp, now - sent)
+    finally:
+        sock.close()
+
+
+def main():
+    args = vars(ap.parse_args())
+
+    for msg in subscribe(args["socket"]):
+        print("{} {:.3f} {} {} {} {:.2f}ms".format(
+            msg.index, msg.timestamp, msg.action, msg.head_action,
+            msg.eye_action, 1000 * msg.latency))
+
+if __name__ == "__main__":
+    main()
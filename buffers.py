@@ -0,0 +1,54 @@
+import numpy as np
+
+
+class BufferPool():
+    """Preallocated arrays handed out by key, reused from frame to frame.
+
+    get() serves a contiguous view of a flat backing array that only grows,
+    so ROIs whose size changes every frame stop allocating once the largest
+    one has been seen. Arrays allocated elsewhere, such as the frames
+    VideoCapture.read(image=) falls back to, are kept with put().
+
+    allocations counts every array the pool had to create or adopt; in steady
+    state it stops increasing.
+    """
+    def __init__(self):
+        self.__buffers = {}
+
+        self.allocations = 0
+
+    def get(self, key, shape, dtype=np.uint8):
+        """
+        Args:
+            key: Any hashable naming the buffer. A key is one buffer, so the
+                 previous array under it is overwritten by the next user.
+            shape: Shape of the array wanted.
+        Returns:
+            Uninitialized contiguous array of shape and dtype.
+        """
+        size = int(np.prod(shape))
+
+        backing = self.__buffers.get(key)
+        if backing is None or backing.dtype != dtype or backing.size < size:
+            capacity = size if backing is None or backing.dtype != dtype \
+                else max(size, 2 * backing.size)
+            backing = np.empty(capacity, dtype=dtype)
+            self.__buffers[key] = backing
+            self.allocations += 1
+
+        return backing[:size].reshape(shape)
+
+    def peek(self, key):
+        """The array kept under key with put(), or None."""
+        return self.__buffers.get(key)
+
+    def put(self, key, array):
+        """Keeps an array allocated outside the pool under key."""
+        self.__buffers[key] = array
+        self.allocations += 1
+
+    def stats(self):
+        return {
+            "allocations": self.allocations,
+            "pool_kb": sum(b.nbytes for b in self.__buffers.values()) // 1024,
+        }
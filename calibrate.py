@@ -0,0 +1,194 @@
+import os
+import json
+import argparse
+
+import numpy as np
+
+import head
+import eyes
+
+from features import extract_features
+from sources import load_landmarks
+from detection import classify_heads, classify_eyes
+
+PROFILE_PATH = "~/.kender/profile.json"
+
+_GRID_SIZE = 41
+_ROUNDS = 3
+
+# Search range of every tunable threshold, by module.
+HEAD_RANGES = {
+    "UP_THRESH": (0.0, 1.0),
+    "DOWN_THRESH": (0.0, 1.5),
+    "ZOOM_THRESH": (0.2, 1.0),
+}
+EYE_RANGES = {
+    "_EYE_HIST_THRESH": (0.0, 0.2),
+    "_EYE_DIFF_THRESH": (1.0, 4.0),
+    "_LEAN_THRESH": (0.0, 40.0),
+}
+
+ap = argparse.ArgumentParser(description="Tunes the Head/Eyes thresholds on "
+                                         "a labelled landmark session.")
+ap.add_argument("-i", "--input", required=True,
+                help="Labelled .npz session, or a recorded session file.")
+ap.add_argument("-l", "--labels", required=False,
+                help=".npz with head_labels and eye_labels for a recorded "
+                     "session file.")
+ap.add_argument("-o", "--output", default=PROFILE_PATH, required=False,
+                help="Where to write the calibration profile.")
+
+
+def load_session(path, labels=None):
+    """Loads a labelled session recording.
+
+    The recording holds the LandmarkSource fields (landmarks, width, l_hist,
+    r_hist and optionally present). The labels, head_labels and eye_labels,
+    are the HeadAction and EyeAction values the user was actually performing
+    in every frame. They come from the labels .npz if given, otherwise from
+    the recording itself.
+
+    Returns:
+        Features, l_hist, r_hist, head_labels and eye_labels of every frame
+        with a face.
+    """
+    data = dict(load_landmarks(path))
+    if labels is not None:
+        data.update(np.load(labels))
+
+    present = data["present"] if "present" in data \
+        else np.ones(len(data["landmarks"]), dtype=bool)
+    # Frames decided by eyes.AspectGate were recorded without histograms.
+    present = present & np.isfinite(data["l_hist"]) & \
+        np.isfinite(data["r_hist"])
+
+    features = extract_features(data["landmarks"][present], int(data["width"]))
+
+    return (features, data["l_hist"][present], data["r_hist"][present],
+            data["head_labels"][present], data["eye_labels"][present])
+
+
+def balanced_accuracy(predicted, labels):
+    """Mean per-class recall, so resting frames don't drown out gestures.
+
+    Args:
+        predicted: (..., F) predicted codes, e.g. one row per candidate.
+        labels: (F,) true codes.
+    Returns:
+        (...) scores.
+    """
+    recalls = [(predicted[..., labels == c] == c).mean(axis=-1)
+               for c in np.unique(labels)]
+
+    return np.mean(recalls, axis=0)
+
+
+def search(ranges, params, score):
+    """Coordinate descent over a grid for every threshold.
+
+    Each step scores the whole grid of one threshold against every frame in
+    a single broadcast evaluation.
+
+    Args:
+        ranges: Threshold name to (low, high).
+        params: Starting threshold values; updated in place.
+        score: Maps a params dict, one entry of which is a (K, 1) array, to
+               (K,) scores.
+    Returns:
+        params and its score.
+    """
+    for _ in range(_ROUNDS):
+        for name, (low, high) in ranges.items():
+            grid = np.linspace(low, high, _GRID_SIZE)
+            trial = dict(params, **{name: grid[:, None]})
+
+            params[name] = float(grid[np.argmax(score(trial))])
+
+    best = score({k: np.asarray([v])[:, None] for k, v in params.items()})
+
+    return params, float(best[0])
+
+
+def calibrate(features, l_hist, r_hist, head_labels, eye_labels):
+    """Finds the thresholds that best reproduce the labels.
+
+    _C_FLOOR is not tuned: it acts on eye pixels, which the session does not
+    keep.
+
+    Returns:
+        Profile dictionary and the before/after scores.
+    """
+    def head_score(p):
+        predicted = classify_heads(features, p["UP_THRESH"],
+                                   p["DOWN_THRESH"], p["ZOOM_THRESH"])
+        return balanced_accuracy(predicted, head_labels)
+
+    def eye_score(p):
+        predicted = classify_eyes(l_hist, r_hist, features.lean,
+                                  p["_EYE_HIST_THRESH"],
+                                  p["_EYE_DIFF_THRESH"], p["_LEAN_THRESH"])
+        return balanced_accuracy(predicted, eye_labels)
+
+    head_params = {k: getattr(head, k) for k in HEAD_RANGES}
+    eye_params = {k: getattr(eyes, k) for k in EYE_RANGES}
+
+    before = (float(head_score(head_params)), float(eye_score(eye_params)))
+
+    head_params, head_after = search(HEAD_RANGES, head_params, head_score)
+    eye_params, eye_after = search(EYE_RANGES, eye_params, eye_score)
+
+    profile = {"head": head_params, "eyes": eye_params}
+
+    return profile, before, (head_after, eye_after)
+
+
+def save_profile(profile, path=PROFILE_PATH):
+    path = os.path.expanduser(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=2)
+
+
+def load_profile(path=PROFILE_PATH):
+    """Reads a calibration profile.
+
+    The thresholds are passed on to Head and Eyes (see their thresholds
+    argument); the module defaults are never changed.
+
+    Returns:
+        The profile, {"head": {...}, "eyes": {...}}, or None if there is no
+        profile at path.
+    """
+    path = os.path.expanduser(path)
+    if not os.path.isfile(path):
+        return None
+
+    with open(path) as f:
+        profile = json.load(f)
+
+    for ranges, values in ((HEAD_RANGES, profile["head"]),
+                           (EYE_RANGES, profile["eyes"])):
+        for name in values:
+            if name not in ranges:
+                raise ValueError("Unknown threshold in {}: {}"
+                                 .format(path, name))
+
+    return profile
+
+
+def main():
+    args = vars(ap.parse_args())
+
+    session = load_session(args["input"], args["labels"])
+    profile, before, after = calibrate(*session)
+    save_profile(profile, args["output"])
+
+    print("head balanced accuracy: {:.3f} -> {:.3f}".format(before[0],
+                                                            after[0]))
+    print("eyes balanced accuracy: {:.3f} -> {:.3f}".format(before[1],
+                                                            after[1]))
+    print(json.dumps(profile, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,634 @@
+import signal
+import asyncio
 import datetime
-import cv2
+import inspect
+import threading
 import dlib
 import math
 import time
+import numpy as np
 
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from imutils import face_utils
 
 from head import Head
-from eyes import Eyes
+from eyes import Eyes, AspectGate, aspect_closed
+from smoothing import LandmarkSmoother
 from display import *
-from utils import COUNTER_LOG, put_text, resize_frame
+from utils import put_text, FramePreprocessor, RateLimiter
+from features import extract_features
 from detection import detect_head, detect_eyes
-from action import ActionHandler, HEAD_REST_STATE
+from action import ActionHandler, HeadAction, EyeAction, HEAD_REST_STATE
+from pipeline import FrameRing, CameraReader, ActionDispatcher, pipeline_stats
+from tracking import FaceTracker, FaceSelector, TRACK_CORRELATION, \
+    SELECT_STICKY, SELECT_ALL
+from detectors import ScaledDetector, make_detector, DETECTOR_HOG
+from sources import WebcamSource
+from calibrate import load_profile
+from recorder import SessionRecorder
+from buffers import BufferPool
+from metrics import MetricsRegistry
+from viewer import FrameViewer
+from scheduler import AdaptiveScheduler, IDLE_AFTER, IDLE_FPS
 
-CALIBRATE = True
+_IDLE_DETECT_SCALE = 0.5
 
-def capture_action(pred_path, cb, debug=False, log=False):
+FaceResult = namedtuple("FaceResult", [
+    "rect", "shape", "features", "head", "eyes",
+    "head_action", "eye_action", "action", "face_id"])
+
+StreamEvent = namedtuple("StreamEvent", [
+    "timestamp",    # Frame time in seconds.
+    "index",        # Frame number within the source.
+    "face_id",
+    "action",       # Confirmed action, None if none fired on this frame.
+    "head_action",  # Raw classification of this frame.
+    "eye_action",
+    "latency",      # Seconds from capture (read, for recordings) to event.
+])
+
+
+class FrameProcessor():
+    """Everything capture_action does to a single frame.
+
+    The face detector backend is picked by detector and cascade (see
+    detectors.make_detector). It only runs every redetect_interval frames; in
+    between the faces are tracked with track_mode (see tracking.FaceTracker).
+    Detection runs on a frame downscaled by detect_scale, landmarks at full
+    resolution.
+    Recorded landmark frames skip detection and prediction altogether.
+
+    Gestures are confirmed over the frames' timestamps unless count_frames is
+    set, in which case the ActionHandler falls back to counting frames.
+
+    The Head/Eyes thresholds come from the calibration profile at profile,
+    if given and present (see calibrate.py); every processor keeps its own.
+
+    Only the face picked by face_policy is predicted and classified (see
+    tracking.FaceSelector). With the "all" policy every face is processed
+    and each tracked face gets its own ActionHandler. Per-face state is kept
+    while the selector remembers the face, so a few missed detections do not
+    reset a face's gestures.
+
+    Every stage is timed into metrics, a metrics.MetricsRegistry, if it is
+    enabled.
+
+    With eye_fallback set, eye states come from the landmarks' aspect ratios
+    and at most that share of faces goes through the pixel based Eyes
+    pipeline (see eyes.AspectGate). Recorded faces whose eyes were decided
+    that way have no histograms and are decided from their landmarks again.
+
+    With smooth set, every face's landmarks go through a one euro filter and
+    the shape predictor may be skipped for up to predictor_interval - 1
+    frames while the face holds still (see smoothing.LandmarkSmoother).
+    """
+    def __init__(self, pred_path=None, redetect_interval=1,
+                 track_mode=TRACK_CORRELATION, detect_scale=1.0,
+                 count_frames=False, profile=None,
+                 face_policy=SELECT_STICKY, metrics=None,
+                 detector=DETECTOR_HOG, cascade=None, eye_fallback=None,
+                 smooth=False, predictor_interval=1):
+        thresholds = load_profile(profile) if profile is not None else None
+        self.__head_thresholds = thresholds["head"] if thresholds else None
+        self.__eye_thresholds = thresholds["eyes"] if thresholds else None
+
+        self.metrics = metrics if metrics is not None \
+            else MetricsRegistry(enabled=False)
+        self.__gate = AspectGate(eye_fallback) if eye_fallback is not None \
+            else None
+        self.action_handler = ActionHandler()
+        self.__handlers = {}
+        self.__smoothers = {}
+        self.__smooth = smooth or predictor_interval > 1
+        self.__predictor_interval = predictor_interval
+        self.__count_frames = count_frames
+        self.__selector = FaceSelector(face_policy)
+        self.__per_face = face_policy == SELECT_ALL
+
+        self.__predictor = None
+        if pred_path is not None:
+            self.__predictor = dlib.shape_predictor(pred_path)
+
+        self.pool = BufferPool()
+        backend = make_detector(detector, cascade)
+        self.__idle_detector = ScaledDetector(
+            backend, min(detect_scale, _IDLE_DETECT_SCALE), self.pool)
+        self.__tracker = FaceTracker(
+            ScaledDetector(backend, detect_scale, self.pool),
+            redetect_interval, track_mode)
+        self.__preprocess = FramePreprocessor(self.pool)
+
+    def process(self, frame, cheap=False):
+        """
+        Args:
+            frame: sources.Frame.
+            cheap: Looks for faces on a coarser image; used while idle.
+        Returns:
+            The preprocessed BGR frame (None for recorded landmarks) and a
+            FaceResult for every face found in it.
+        """
+        if frame.image is None:
+            if frame.landmarks is None:
+                return None, []
+
+            shape = frame.landmarks
+            if self.__smooth:
+                shape = self.__smoother(0).measure(shape, frame.timestamp)
+
+            face = self.__face(frame, 0, None, shape, frame.width, None,
+                               frame.hists)
+            return None, [face]
+
+        metrics = self.metrics
+        t = metrics.clock()
+
+        image, gray = self.__preprocess(frame.image, frame.cropped)
+        h, w, _ = image.shape
+        t = metrics.lap("preprocess", t)
+
+        rects = self.__tracker.rects(gray, self.__idle_detector if cheap
+                                     else None)
+        picked = self.__selector.select(rects, w, h)
+        self.__tracker.retain([i for i, _ in picked])
+        t = metrics.lap("detect", t)
+
+        faces, shapes = [], []
+        for i, face_id in picked:
+            shape = self.__landmarks(gray, rects[i], face_id, frame.timestamp)
+            shapes.append(shape)
+            metrics.lap("predict", t)
+
+            faces.append(self.__face(frame, face_id, rects[i], shape, w,
+                                     gray))
+            t = metrics.clock()
+
+        self.__tracker.follow(shapes)
+
+        live = self.__selector.face_ids()
+        for tracked in (self.__handlers, self.__smoothers):
+            for face_id in list(tracked):
+                if face_id not in live:
+                    del tracked[face_id]
+
+        return image, faces
+
+    def __smoother(self, face_id):
+        if face_id not in self.__smoothers:
+            self.__smoothers[face_id] = LandmarkSmoother(
+                self.__predictor_interval)
+
+        return self.__smoothers[face_id]
+
+    def __landmarks(self, gray, rect, face_id, timestamp):
+        if not self.__smooth:
+            return face_utils.shape_to_np(self.__predictor(gray, rect))
+
+        smoother = self.__smoother(face_id)
+        if smoother.can_predict():
+            self.metrics.inc("landmarks", "predicted")
+            return smoother.predict(timestamp)
+
+        self.metrics.inc("landmarks", "measured")
+        shape = face_utils.shape_to_np(self.__predictor(gray, rect))
+
+        return smoother.measure(shape, timestamp)
+
+    def eye_fallback_rate(self):
+        """Share of faces sent to the Eyes pipeline; None if not gated."""
+        return self.__gate.fallback_rate() if self.__gate else None
+
+    def __handler(self, face_id):
+        if not self.__per_face:
+            return self.action_handler
+
+        if face_id not in self.__handlers:
+            self.__handlers[face_id] = ActionHandler()
+
+        return self.__handlers[face_id]
+
+    def __face(self, frame, face_id, rect, shape, width, gray, hists=None):
+        metrics = self.metrics
+        t = metrics.clock()
+
+        features = extract_features(shape, width)
+        t = metrics.lap("features", t)
+        closed = None
+        if hists is None:
+            if self.__gate is not None:
+                closed = self.__gate.closed(features)
+        elif not all(math.isfinite(h) for h in hists):
+            # Decided by the gate when recorded, so there is no histogram
+            # to go by; decide again from the recorded landmarks.
+            closed = aspect_closed(features)
+        cur_eyes = Eyes(features, gray, hists, self.pool, closed,
+                        self.__eye_thresholds)
+        t = metrics.lap("eyes", t)
+        cur_head = Head(features, self.__head_thresholds)
+        t = metrics.lap("head", t)
+
+        eye_action = detect_eyes(features, cur_eyes)
+        head_action = detect_head(features, cur_head)
+        t = metrics.lap("classify", t)
+
+        timestamp = None if self.__count_frames else frame.timestamp
+        perform, action = self.__handler(face_id).get_next(
+            eye_action, head_action, timestamp)
+        metrics.lap("handler", t)
+
+        return FaceResult(rect, shape, features, cur_head, cur_eyes,
+                          head_action, eye_action, action if perform else None,
+                          face_id)
+
+
+class ActionStream():
+    """Pull based stream of the actions and classifications of every frame.
+
+    Frames are only read and processed when the consumer asks for the next
+    event, so a slow consumer holds the capture back instead of queueing up
+    stale events. In pipelined mode the reader thread keeps the newest frame
+    ready meanwhile. Iterate with for, or with async for from a coroutine:
+    the async iterator runs the pipeline on a worker thread, so the event
+    loop stays free for other coroutines.
+
+    start() is implied by iterating. stop() ends the stream after the current
+    frame and may be called from any thread; close() also releases the
+    camera. with and async with do both.
+
+    Args:
+        pred_path: Path to the facial landmark predictor.
+        source: sources.FrameSource, the default webcam if None.
+        pipelined: Reads the source on its own thread, see capture_action.
+        record: Session file for the primary face, see recorder.py.
+        idle_after, idle_fps: See scheduler.AdaptiveScheduler.
+        metrics: metrics.MetricsRegistry the stream times its stages and
+                 counts its decisions into; a disabled one if None.
+        options: Passed on to FrameProcessor.
+    """
+    def __init__(self, pred_path=None, source=None, pipelined=False,
+                 record=None, idle_after=IDLE_AFTER, idle_fps=IDLE_FPS,
+                 metrics=None, **options):
+        self.__pred_path = pred_path
+        self.__source = source
+        self.__pipelined = pipelined
+        self.__record = record
+        self.__idle_after = idle_after
+        self.__idle_fps = idle_fps
+        self.__options = options
+
+        self.metrics = metrics if metrics is not None \
+            else MetricsRegistry(enabled=False)
+
+        self.__stopped = threading.Event()
+        self.__frames = None
+        self.__ring = None
+        self.__scheduler = None
+        self.__aevents = None
+        self.__pools = []
+        self.__processor = None
+        self.__recorder = None
+
+    def start(self):
+        if self.__frames is None:
+            self.__frames = self.__run()
+
+        return self
+
+    def stop(self):
+        self.__stopped.set()
+
+    def close(self):
+        self.stop()
+
+        if self.__frames is None:
+            return
+
+        if inspect.getgeneratorstate(self.__frames) == inspect.GEN_CREATED:
+            # Never iterated, so the pipeline was not set up.
+            if self.__source is not None:
+                self.__source.release()
+
+        self.__frames.close()
+
+    def stats(self):
+        stats = self.__scheduler.stats() if self.__scheduler else {}
+        if self.__ring is not None:
+            stats.update(pipeline_stats(self.__ring))
+        if self.__pools:
+            stats["pool_allocations"] = sum(p.allocations
+                                            for p in self.__pools)
+        if self.__recorder is not None:
+            stats["records_dropped"] = self.__recorder.dropped
+        if self.__processor is not None \
+                and self.__processor.eye_fallback_rate() is not None:
+            stats["eye_fallback"] = round(
+                self.__processor.eye_fallback_rate(), 3)
+
+        return stats
+
+    def __run(self):
+        metrics = self.metrics
+        processor = FrameProcessor(self.__pred_path, metrics=metrics,
+                                   **self.__options)
+        self.__processor = processor
+
+        # Opened first, so a bad path raises before the camera is opened.
+        recorder = None
+        if self.__record is not None:
+            recorder = SessionRecorder(self.__record)
+            recorder.start()
+            self.__recorder = recorder
+
+        source = self.__source
+        if source is None:
+            source = WebcamSource()
+
+        self.__pools = [p for p in (processor.pool, source.pool) if p]
+
+        # Recorded sources are never throttled.
+        scheduler = AdaptiveScheduler(
+            self.__idle_after if source.live else 0, self.__idle_fps)
+        self.__scheduler = scheduler
+
+        reader = None
+        if self.__pipelined:
+            self.__ring = FrameRing()
+            reader = CameraReader(source, self.__ring, scheduler)
+            reader.start()
+
+            def read_frame():
+                frame = self.__ring.pop_latest()[0]
+                if frame is None or source.pool is None:
+                    return frame
+
+                # The reader keeps filling the capture rotation while this
+                # frame is processed, so it works on its own copy.
+                image = processor.pool.get("handoff", frame.image.shape)
+                np.copyto(image, frame.image)
+
+                return frame._replace(image=image)
+        else:
+            read_frame = source.read
+
+        try:
+            while not source.exhausted and not self.__stopped.is_set():
+                if reader is None:
+                    # The reader paces itself, see CameraReader.
+                    scheduler.wait()
+
+                metrics.begin_frame()
+                t = metrics.clock()
+                frame = read_frame()
+                if frame is None:
+                    if reader is None:
+                        scheduler.read_failed()
+                    continue
+                metrics.lap("capture", t)
+
+                read_at = time.monotonic()
+                image, faces = processor.process(frame, scheduler.idle)
+                scheduler.frame_done(bool(faces))
+
+                for face in faces:
+                    metrics.inc("classified", face.eye_action)
+                    metrics.inc("classified", face.head_action)
+                    if face.action is not None:
+                        metrics.inc("fired", face.action)
+
+                if recorder is not None:
+                    width = frame.width if image is None else image.shape[1]
+                    recorder.record(frame.timestamp, width,
+                                    faces[0] if faces else None)
+
+                # Live frames carry their capture time on the same clock.
+                since = frame.timestamp if source.live else read_at
+
+                yield frame, image, faces, time.monotonic() - since
+        finally:
+            if reader is not None:
+                reader.stop()
+            if recorder is not None:
+                recorder.stop()
+
+            source.release()
+
+    def frames(self):
+        """
+        Yields:
+            The sources.Frame, preprocessed image (None for recorded
+            landmarks), FaceResult list and latency of every frame. Both
+            images live in reused buffers and are only valid until the next
+            frame is requested; copy them to keep them.
+        """
+        return self.start().__frames
+
+    def __iter__(self):
+        try:
+            for frame, _, faces, latency in self.frames():
+                for face in faces:
+                    yield StreamEvent(frame.timestamp, frame.index,
+                                      face.face_id, face.action,
+                                      face.head_action, face.eye_action,
+                                      latency)
+        finally:
+            self.close()
+
+    def __aiter__(self):
+        self.__aevents = self.__aiterate()
+
+        return self.__aevents
+
+    async def __aiterate(self):
+        loop = asyncio.get_running_loop()
+        events = iter(self)
+
+        # One thread, so the generator only ever runs on it.
+        with ThreadPoolExecutor(1, "action-stream") as executor:
+            try:
+                while True:
+                    event = await loop.run_in_executor(executor, next,
+                                                       events, None)
+                    if event is None:
+                        return
+
+                    yield event
+            finally:
+                self.stop()
+                await loop.run_in_executor(executor, events.close)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.stop()
+
+        if self.__aevents is not None:
+            await self.__aevents.aclose()
+
+        self.close()
+
+
+@contextmanager
+def stop_on_signals(stop, signals=(signal.SIGINT, signal.SIGTERM)):
+    """Calls stop() instead of dying on SIGINT/SIGTERM for the duration.
+
+    Signal handlers can only be set on the main thread; elsewhere this does
+    nothing.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    previous = {s: signal.signal(s, lambda *_: stop()) for s in signals}
+    try:
+        yield
+    finally:
+        for s, handler in previous.items():
+            signal.signal(s, handler)
+
+
+def capture_action(pred_path, cb, debug=False, log=False, pipelined=False,
+                   source=None, record=None, idle_after=IDLE_AFTER,
+                   idle_fps=IDLE_FPS, stop=None, profiler=None,
+                   slow_frames=None, **options):
     """Facial detection and real time processing credit goes to:
 
     https://www.pyimagesearch.com/2017/04/17/real-time-facial-landmark-detection-opencv-python-dlib/
+
+    Calls cb with every action of an ActionStream. The loop ends when stop (a
+    threading.Event) is set, on SIGINT/SIGTERM, or when a finite source runs
+    out. Without debug it never touches the OpenCV GUI.
+
+    With debug set, the capture loop moves to a worker thread and the calling
+    thread runs a viewer.FrameViewer, which also stops everything on a "q"
+    keypress. The loop only draws a frame when the viewer is ready for one.
+    With log set, the counters and stream statistics are printed once a
+    second.
+
+    With pipelined set, the source is read on its own thread into a small ring
+    of the newest frames and actions are dispatched on another thread. The
+    processing stage always works on the freshest frame and drops stale ones.
+
+    profiler, a profiling.ProfileWindow, is ticked on the thread that runs
+    the pipeline. Every frame is checked against slow_frames, a
+    profiling.SlowFrameDumper; its stage breakdown needs enabled metrics.
+
+    The other arguments are passed on to ActionStream.
     """
-    action_handler = ActionHandler()
+    if stop is None:
+        stop = threading.Event()
+
+    stream = ActionStream(pred_path, source, pipelined, record, idle_after,
+                          idle_fps, **options)
+    viewer = FrameViewer(stop) if debug else None
+
+    def halt():
+        # The stream also checks its own flag while no frame arrives, so a
+        # camera that stopped delivering cannot keep the loop alive.
+        stop.set()
+        stream.stop()
+
+    def run():
+        try:
+            _run_engine(stream, cb, stop, viewer, log, pipelined, profiler,
+                        slow_frames)
+        finally:
+            stop.set()
+
+    with stop_on_signals(halt):
+        if viewer is None:
+            run()
+            return
 
-    detector = dlib.get_frontal_face_detector()
-    predictor = dlib.shape_predictor(pred_path)
+        engine = threading.Thread(target=run, name="capture-engine",
+                                  daemon=True)
+        engine.start()
+        viewer.run()
 
-    camera = cv2.VideoCapture(0)
+        halt()
+        engine.join()
 
-    while True:
-        _, frame = camera.read()
-        if frame is None:
-            continue
 
-        _, w_original, _ = frame.shape
-        frame = resize_frame(frame)
+def _run_engine(stream, cb, stop, viewer, log, pipelined, profiler=None,
+                slow_frames=None):
+    dispatcher = None
+    if pipelined:
+        dispatcher = ActionDispatcher(cb)
+        dispatcher.start()
 
-        h, w, _ = frame.shape
+        dispatch = dispatcher.submit
+    else:
+        dispatch = cb
 
-        display_bounds(frame)
+    def stats():
+        stats = stream.stats()
+        if dispatcher is not None:
+            stats.update(pipeline_stats(dispatcher=dispatcher))
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        rects = detector(gray, 0)
+        return stats
 
-        for rect in rects:
-            shape = predictor(gray, rect)
-            shape = face_utils.shape_to_np(shape)
+    metrics = stream.metrics
+    for action in list(HeadAction) + list(EyeAction):
+        metrics.inc("fired", action, 0)
+    fired = metrics.counts("fired")
 
-            cur_head = Head(shape, w)
-            cur_eyes = Eyes(shape, frame)
+    log_limit = RateLimiter()
 
-            eye_action = detect_eyes(shape, cur_eyes)
-            head_action = detect_head(shape, cur_head)
+    with stream:
+        for frame, image, faces, latency in stream.frames():
+            if stop.is_set():
+                break
 
-            COUNTER_LOG[eye_action] += 1
-            COUNTER_LOG[head_action] += 1
+            if profiler is not None:
+                profiler.tick()
+            if slow_frames is not None:
+                slow_frames.check(frame, faces, latency, metrics.frame)
 
-            perform, action = action_handler.get_next(eye_action, head_action)
+            for face in faces:
+                if face.action is not None:
+                    t = metrics.clock()
+                    dispatch(face.action)
+                    metrics.lap("dispatch", t)
 
-            if log:
-                display_decisions(frame, head_action, eye_action)
-                display_counters(frame, COUNTER_LOG)
+            if log and log_limit.ready():
+                print(", ".join("{}: {}".format(k, v)
+                                for k, v in fired.items()))
+                print(stats())
+                if metrics.enabled:
+                    print(metrics.means())
 
-            if perform:
-                COUNTER_LOG[action] += 1
-                cb(action)
+            if viewer is not None and image is not None \
+                    and viewer.wants_frame():
+                # The preprocessor reuses its buffer for the next frame.
+                image = image.copy()
+                display_bounds(image)
 
-            if debug:
-                cur_head.debug(frame)
-                cur_eyes.debug(frame)
+                # Once per frame, with or without faces, so the idle mode
+                # shows too.
+                if log:
+                    display_counters(image, fired)
+                    display_stats(image, stats())
 
-                cv2.imshow("Frame", frame)
+                for face in faces:
+                    if log:
+                        display_decisions(image, face.head_action,
+                                          face.eye_action)
 
-        key = cv2.waitKey(1) & 0xFF
+                    face.head.debug(image)
+                    face.eyes.debug(image)
 
-        if key == ord("q"):
-            break
+                viewer.submit(image)
 
-    cv2.destroyAllWindows()
+    if dispatcher is not None:
+        dispatcher.stop()
+    if profiler is not None:
+        profiler.close()
+    if slow_frames is not None:
+        slow_frames.close()
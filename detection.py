@@ -6,6 +6,9 @@ import numpy as np
 
 from utils import *
 
+import head
+import eyes
+
 from action import HeadAction, EyeAction
 from scipy.spatial import ConvexHull
 
@@ -18,7 +21,7 @@ DEBUG_EYES = True
 # to make detection more sensitive:
 
 # returns what position the head is in
-def detect_head(shape, cur_head):
+def detect_head(features, cur_head):
     head_state = HeadAction.CENTER
 
     if cur_head.turned_left():
@@ -34,7 +37,7 @@ def detect_head(shape, cur_head):
 
     return head_state
 
-def detect_eyes(shape, cur_eyes):
+def detect_eyes(features, cur_eyes):
     eye_action = EyeAction.BOTH_OPEN
 
     if cur_eyes.leaning():
@@ -50,3 +53,69 @@ def detect_eyes(shape, cur_eyes):
         return EyeAction.RIGHT_CLOSED
 
     return EyeAction.BOTH_OPEN
+
+def classify_heads(features, up=None, down=None, zoom=None):
+    """Vectorized detect_head over a batch of features.
+
+    Thresholds default to the ones in head.py. Passing (K, 1) arrays scores K
+    candidate thresholds against every frame at once.
+
+    Args:
+        features: features.Features of F faces or frames.
+        up, down, zoom: UP_THRESH, DOWN_THRESH and ZOOM_THRESH overrides.
+    Returns:
+        HeadAction values, shaped like the broadcast thresholds and frames.
+    """
+    up = head.UP_THRESH if up is None else up
+    down = head.DOWN_THRESH if down is None else down
+    zoom = head.ZOOM_THRESH if zoom is None else zoom
+
+    nx, ny = features.nose_tip[..., 0], features.nose_tip[..., 1]
+    hy, cy = features.head[..., 1], features.chin[..., 1]
+    nc = features.nc_ratio
+
+    left = nx < features.left_mid[..., 0]
+    right = nx > features.right_mid[..., 0]
+    zoomed = features.zoom_ratio > zoom
+    upward = (ny < hy) & (nc > up)
+    downward = (hy < ny) & (ny < cy) & (nc > down)
+
+    conditions = np.broadcast_arrays(left, right, zoomed, upward, downward)
+    states = [HeadAction.LEFT, HeadAction.RIGHT, HeadAction.ZOOM,
+              HeadAction.UP, HeadAction.DOWN]
+
+    return np.select(conditions, [s.value for s in states],
+                     HeadAction.CENTER.value)
+
+def classify_eyes(l_hist, r_hist, lean, hist_thresh=None, diff_thresh=None,
+                  lean_thresh=None):
+    """Vectorized detect_eyes over per-frame eye histograms.
+
+    Thresholds default to the ones in eyes.py and broadcast like in
+    classify_heads.
+
+    Args:
+        l_hist, r_hist: (F,) eye histograms as computed by Eyes.
+        lean: (F,) features.Features.lean.
+        hist_thresh, diff_thresh, lean_thresh: _EYE_HIST_THRESH,
+            _EYE_DIFF_THRESH and _LEAN_THRESH overrides.
+    Returns:
+        EyeAction values.
+    """
+    hist_thresh = eyes._EYE_HIST_THRESH if hist_thresh is None \
+        else hist_thresh
+    diff_thresh = eyes._EYE_DIFF_THRESH if diff_thresh is None \
+        else diff_thresh
+    lean_thresh = eyes._LEAN_THRESH if lean_thresh is None else lean_thresh
+
+    l_closed = (diff_thresh * l_hist < r_hist) | (l_hist < hist_thresh)
+    r_closed = (diff_thresh * r_hist < l_hist) | (r_hist < hist_thresh)
+    leaning = lean > lean_thresh
+
+    conditions = np.broadcast_arrays(leaning, l_closed & r_closed, l_closed,
+                                     r_closed)
+    states = [EyeAction.BOTH_OPEN, EyeAction.BOTH_CLOSED,
+              EyeAction.LEFT_CLOSED, EyeAction.RIGHT_CLOSED]
+
+    return np.select(conditions, [s.value for s in states],
+                     EyeAction.BOTH_OPEN.value)
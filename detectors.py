@@ -0,0 +1,160 @@
+import os
+
+import cv2
+import dlib
+
+DETECT_SCALES = (1.0, 0.5, 0.25)
+
+DETECTOR_HOG = "hog"
+DETECTOR_HAAR = "haar"
+DETECTOR_LBP = "lbp"
+DETECTOR_HYBRID = "hybrid"
+DETECTORS = (DETECTOR_HOG, DETECTOR_HAAR, DETECTOR_LBP, DETECTOR_HYBRID)
+
+_CASCADES = {
+    DETECTOR_HAAR: "haarcascade_frontalface_default.xml",
+    DETECTOR_LBP: "lbpcascade_frontalface_improved.xml",
+}
+# The pip wheels only ship the Haar cascades in cv2.data; system installs
+# keep both kinds here.
+_CASCADE_DIRS = ("/usr/share/opencv4", "/usr/local/share/opencv4",
+                 "/usr/share/opencv", "/usr/local/share/opencv")
+
+_SCALE_FACTOR = 1.1
+_MIN_NEIGHBORS = 5
+_MIN_FACE = 0.2         # Smallest face as a fraction of the frame height.
+
+
+def scale_rect(rect, factor):
+    """Scales a dlib.rectangle by factor about the origin."""
+    return dlib.rectangle(int(rect.left() * factor), int(rect.top() * factor),
+                          int(rect.right() * factor),
+                          int(rect.bottom() * factor))
+
+
+class ScaledDetector():
+    """Runs a face detector on a downscaled copy of the frame.
+
+    A face at webcam distance fills a large part of the frame, so detecting on
+    a 1/2 or 1/4 image finds the same faces for roughly scale^2 of the cost.
+    Rectangles are mapped back to full resolution so the shape predictor keeps
+    its full landmark precision.
+
+    With a buffers.BufferPool the downscaled frame is written into a pooled
+    buffer instead of a new array every call.
+    """
+    def __init__(self, detector, scale=1.0, pool=None):
+        if not 0 < scale <= 1:
+            raise ValueError("Detection scale must be in (0, 1]: {}"
+                             .format(scale))
+
+        self.__detector = detector
+        self.__scale = scale
+        self.__pool = pool
+
+    def __call__(self, gray, upsample=0):
+        if self.__scale == 1.0:
+            return list(self.__detector(gray, upsample))
+
+        small = None
+        if self.__pool is not None:
+            # Rounded like cv2.resize rounds the size it computes itself.
+            h, w = gray.shape[:2]
+            small = self.__pool.get(("detect", self.__scale),
+                                    (round(h * self.__scale),
+                                     round(w * self.__scale)))
+        small = cv2.resize(gray, None, small, self.__scale, self.__scale,
+                           cv2.INTER_AREA)
+
+        return [scale_rect(r, 1 / self.__scale)
+                for r in self.__detector(small, upsample)]
+
+
+def find_cascade(kind):
+    """Path of the bundled frontal face cascade of kind, haar or lbp."""
+    name = _CASCADES[kind]
+
+    dirs = [d for d in (getattr(getattr(cv2, "data", None), "haarcascades",
+                                None),) if d]
+    dirs += [os.path.join(d, sub) for d in _CASCADE_DIRS
+             for sub in ("haarcascades", "lbpcascades")]
+
+    for d in dirs:
+        path = os.path.join(d, name)
+        if os.path.isfile(path):
+            return path
+
+    raise FileNotFoundError("No {} cascade found, pass one explicitly"
+                            .format(name))
+
+
+class CascadeDetector():
+    """OpenCV Haar or LBP cascade behind the dlib detector call signature.
+
+    Faces smaller than _MIN_FACE of the frame height are not searched for;
+    at webcam distance the user's face is always larger, and skipping the
+    small scales is most of the speedup over HOG.
+    """
+    def __init__(self, path):
+        self.__cascade = cv2.CascadeClassifier(path)
+        if self.__cascade.empty():
+            raise ValueError("Could not load cascade: {}".format(path))
+
+    def __call__(self, gray, upsample=0):
+        size = int(gray.shape[0] * _MIN_FACE)
+
+        boxes = self.__cascade.detectMultiScale(
+            gray, scaleFactor=_SCALE_FACTOR, minNeighbors=_MIN_NEIGHBORS,
+            minSize=(size, size))
+
+        return [dlib.rectangle(int(x), int(y), int(x + w), int(y + h))
+                for x, y, w, h in boxes]
+
+
+class HybridDetector():
+    """Tries a fast detector first and only falls back to a slow one on a miss.
+
+    misses counts the frames the fallback had to run on.
+    """
+    def __init__(self, fast, slow):
+        self.__fast = fast
+        self.__slow = slow
+
+        self.misses = 0
+
+    def __call__(self, gray, upsample=0):
+        rects = self.__fast(gray, upsample)
+        if rects:
+            return rects
+
+        self.misses += 1
+        return list(self.__slow(gray, upsample))
+
+
+def make_detector(kind=DETECTOR_HOG, cascade=None):
+    """Face detector backend by name.
+
+    Args:
+        kind: One of DETECTORS. hybrid runs the LBP cascade, or the Haar one
+              if LBP is not installed, with HOG on misses.
+        cascade: Cascade file overriding the bundled one.
+    Returns:
+        Callable (gray, upsample) -> list of dlib.rectangle.
+    """
+    if kind == DETECTOR_HOG:
+        return dlib.get_frontal_face_detector()
+
+    if kind == DETECTOR_HYBRID:
+        if cascade is None:
+            try:
+                cascade = find_cascade(DETECTOR_LBP)
+            except FileNotFoundError:
+                cascade = find_cascade(DETECTOR_HAAR)
+
+        return HybridDetector(CascadeDetector(cascade),
+                              dlib.get_frontal_face_detector())
+
+    if kind in _CASCADES:
+        return CascadeDetector(cascade or find_cascade(kind))
+
+    raise ValueError("Unknown detector: {}".format(kind))
@@ -14,10 +14,7 @@ def display_bounds(frame):
 
 def display_decisions(frame, head_action, eye_action):
 	h, w, _ = frame.shape
-	print("=================================")
 	align_x, align_y = int(w * 0.05), int(h * 0.8)
-	print(head_action)
-	print(eye_action)
 
 	put_text(frame, str(head_action)[11:],
           (align_x, align_y + 30), scale=1.5, thickness=2)
@@ -31,3 +28,11 @@ def display_counters(frame, counter_logs):
     for i, (k, v) in enumerate(counter_logs.items()):
         text = "{}: {}".format(k, v).ljust(11).lower()
         put_text(frame, text, (align_x, 15 * (i + 1) + align_y))
+
+def display_stats(frame, stats):
+    h, w, _ = frame.shape
+    align_x = int(w * 0.05)
+    align_y = int(h * 0.1)
+    for i, (k, v) in enumerate(stats.items()):
+        text = "{}: {}".format(k, v).lower()
+        put_text(frame, text, (align_x, 15 * (i + 1) + align_y))
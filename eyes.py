@@ -1,17 +1,20 @@
 import cv2
 from utils import *
+from features import point
 
 _EYE_HIST_THRESH = 0.02
 _EYE_DIFF_THRESH = 1.7
 
-_EYE_RECT_MODIFIER = 7
-
 _LEAN_THRESH = 10
 _C_FLOOR = 70
 _ELLIPSE_SCALE = 0.46
 _MASK_THICKNESS = 15
 _DILATE_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
 
+_ASPECT_THRESH = 0.2    # Eyes with a lower aspect ratio are closed.
+_ASPECT_MARGIN = 0.04   # Aspect ratios this close to it are ambiguous.
+_MAX_FALLBACK = 0.2
+
 class Eyes():
     """Eye Status Detection
     For all eye functions the distance between the eyelid and the bottom of
@@ -19,32 +22,75 @@ class Eyes():
 
     source: http://vision.fe.uni-lj.si/cvww2016/proceedings/papers/05.pdf
     """
-    def __init__(self, shape, frame):
+    def __init__(self, features, gray, hists=None, pool=None, closed=None,
+                 thresholds=None):
         """
         Eye indices:
                 *37 *38              *43 *44
             *36         *39      *42         *45
                 *41 *40              *47 *46
-        """
-        left_eye = [shape_coord(shape, i) for i in range(36, 42)]
-        right_eye = [shape_coord(shape, i + 6) for i in range(36, 42)]
 
-        self.__left_eye = shape[36:42]
-        self.__right_eye = shape[42:48]
-
-        self.__l_rect, l_disp = self.__find_eye_roi(self.__left_eye, frame)
-        self.__r_rect, r_disp = self.__find_eye_roi(self.__right_eye, frame)
-
-        self.__l_disp = l_disp
-        self.__r_disp = r_disp
-        self.__l_hist = self.__check_hist(self.__l_rect[2])
-        self.__r_hist = self.__check_hist(self.__r_rect[2])
+        Args:
+            features: features.Features of a single face.
+            gray: Grayscale frame the landmarks were predicted on. Eye ROIs
+                  are views into it, so it must not change before debug().
+            hists: Recorded (left, right) eye histograms. When given, gray
+                   is not used and may be None.
+            pool: buffers.BufferPool for the thresholded eyes. Without one
+                  they are allocated every time.
+            closed: (left, right) eye states already decided from the
+                    landmarks (see AspectGate). No pixel work is done and
+                    the histograms are NaN.
+            thresholds: Calibrated values of the calibrate.EYE_RANGES
+                        thresholds; the module defaults if None.
+        """
+        thresholds = thresholds or {}
+        self.__hist_thresh = thresholds.get("_EYE_HIST_THRESH",
+                                            _EYE_HIST_THRESH)
+        self.__diff_thresh = thresholds.get("_EYE_DIFF_THRESH",
+                                            _EYE_DIFF_THRESH)
+        self.__lean_thresh = thresholds.get("_LEAN_THRESH", _LEAN_THRESH)
+
+        self.__left_eye = features.left_eye
+        self.__right_eye = features.right_eye
+        self.__l_box = features.l_box
+        self.__r_box = features.r_box
+        self.__lean = float(features.lean)
+        self.__gray = gray
+        self.__pool = pool
+
+        if closed is not None:
+            l_box, r_box = self.__l_box, self.__r_box
+            self.__l_rect = (point(l_box[0:2]), point(l_box[2:4]), None)
+            self.__r_rect = (point(r_box[0:2]), point(r_box[2:4]), None)
+
+            self.__l_hist = self.__r_hist = float("nan")
+            self.__l_closed, self.__r_closed = (bool(c) for c in closed)
+            return
+
+        if hists is None:
+            # The thresholded eye is a pooled buffer that the next eye
+            # overwrites, so take each histogram right away.
+            self.__l_rect = self.__find_eye_roi(self.__left_eye, self.__l_box,
+                                                gray)
+            self.__l_hist = self.__check_hist(self.__l_rect[2])
+
+            self.__r_rect = self.__find_eye_roi(self.__right_eye, self.__r_box,
+                                                gray)
+            self.__r_hist = self.__check_hist(self.__r_rect[2])
+        else:
+            l_box, r_box = self.__l_box, self.__r_box
+            self.__l_rect = (point(l_box[0:2]), point(l_box[2:4]), None)
+            self.__r_rect = (point(r_box[0:2]), point(r_box[2:4]), None)
+
+            self.__l_hist, self.__r_hist = (float(h) for h in hists)
 
         self.__l_closed = self.__is_closed(self.__l_hist, self.__r_hist)
         self.__r_closed = self.__is_closed(self.__r_hist, self.__l_hist)
 
-    def __mask_eyelash(self, eye, ellipse):
-        eye_cpy = eye.copy()
+    @staticmethod
+    def __mask_eyelash(eye, ellipse, pool=None):
+        """Whitens the eyelashes and everything outside the eye ellipse."""
         center, size, angle = ellipse
 
         c = (int(center[0]), int(center[1]))
@@ -52,95 +98,122 @@ class Eyes():
                 int(0.7 * _ELLIPSE_SCALE * size[1]))
         angle = int(angle)
 
-        stencil = np.zeros(eye_cpy.shape)
-        cv2.ellipse(stencil, ellipse, 255, -1)
-        cv2.ellipse(eye_cpy, c, axes, angle, 0, 360, 255, _MASK_THICKNESS)
-        cv2.ellipse(eye_cpy, c, axes, angle, 0, 360, 255, _MASK_THICKNESS)
+        if pool is None:
+            stencil = np.empty(eye.shape, dtype=np.uint8)
+        else:
+            stencil = pool.get("eye_stencil", eye.shape)
+        stencil.fill(255)
+        cv2.ellipse(stencil, ellipse, 0, -1)
+        cv2.ellipse(eye, c, axes, angle, 0, 360, 255, _MASK_THICKNESS)
+
+        np.bitwise_or(eye, stencil, out=eye)
+
+    @classmethod
+    def __threshold_eye(cls, gray_eye, rel_eye_points, stages=None,
+                        pool=None):
+        """Thresholds an eye ROI, masks the eyelashes and closes small holes.
+
+        Args:
+            gray_eye: Grayscale eye ROI. It is not modified.
+            rel_eye_points: Eye landmarks relative to the ROI.
+            stages: Optional list that receives a copy of every intermediate
+                    image. Only the debug display asks for them.
+            pool: Optional buffers.BufferPool to threshold into.
+        Returns:
+            Thresholded eye.
+        """
+        thresh = None
+        if pool is not None:
+            thresh = pool.get("eye_thresh", gray_eye.shape)
+
+        _, thresh = cv2.threshold(gray_eye, _C_FLOOR, 255, cv2.THRESH_BINARY,
+                                  dst=thresh)
+        if stages is not None:
+            stages.append(thresh.copy())
+
+        ellipse = cv2.fitEllipse(rel_eye_points)
+        cls.__mask_eyelash(thresh, ellipse, pool)
+        if stages is not None:
+            stages.append(thresh.copy())
 
-        eye_cpy[stencil == 0] = 255
+        cv2.dilate(thresh, _DILATE_KERNEL, dst=thresh, iterations=1)
+        cv2.erode(thresh, _DILATE_KERNEL, dst=thresh, iterations=1)
+        if stages is not None:
+            stages.append(thresh.copy())
 
-        return eye_cpy
+        return thresh
 
-    def __find_eye_roi(self, eye_points, frame):
+    def __find_eye_roi(self, eye_points, box, gray, stages=None):
         """Finds the ROI for eye action parsing.
         Args:
             eye_points:
                    * *
                 *       *
                    * *
-            frame: Current captured frame.
+            box: Eye ROI from features.extract_features.
+            gray: Current grayscale frame.
+            stages: Optional list for the intermediate images.
         Returns:
-            1. Top left and bottom right coordinates for the rectangle that
-               encapsulates the eye coordinates.
+            Top left and bottom right coordinates for the rectangle that
+            encapsulates the eye coordinates, and the thresholded eye.
                 -----------
                 |   * *   |
                 |*       *|
                 |   * *   |
                 -----------
-            2. Thresholded Eye.
-            3. Various stages of the eye transformation stacked horizontally.
         """
-        tlx = eye_points[0][0] - _EYE_RECT_MODIFIER
-        tly = eye_points[1][1] - _EYE_RECT_MODIFIER
+        tl, br = point(box[0:2]), point(box[2:4])
+        (tlx, tly), (brx, bry) = tl, br
 
-        brx = eye_points[3][0] + _EYE_RECT_MODIFIER
-        bry = eye_points[4][1] + _EYE_RECT_MODIFIER
-
-        tl, br = (tlx, tly), (brx, bry)
-
-        rel_eye_points = np.asarray([(x - tlx, y - tly) for x, y in eye_points])
+        rel_eye_points = (eye_points - tl).astype(np.int32)
 
         try:
-            eye = frame[tly:bry, tlx:brx].copy()
-            h, w,_ = eye.shape
-
-            eye_copy = eye.copy()
-
-            gray_eye = cv2.cvtColor(eye.copy(), cv2.COLOR_BGR2GRAY)
-            _, thresh = cv2.threshold(gray_eye, _C_FLOOR, 255,
-                                      cv2.THRESH_BINARY)
-
-            gray_eye_disp = cv2.cvtColor(gray_eye, cv2.COLOR_GRAY2BGR)
-            thresh_disp = cv2.cvtColor(thresh, cv2.COLOR_GRAY2BGR)
-
-            ellipse = cv2.fitEllipse(rel_eye_points)
-
-            thresh = self.__mask_eyelash(thresh, ellipse)
-
-            no_eyelash = cv2.cvtColor(thresh.copy(), cv2.COLOR_GRAY2BGR)
-            dilation = cv2.dilate(thresh, _DILATE_KERNEL, iterations=1)
-            thresh = cv2.erode(dilation, _DILATE_KERNEL, iterations=1)
-            cv2.GaussianBlur(thresh, (3, 3), 0)
-
-            eroded = cv2.cvtColor(thresh.copy(), cv2.COLOR_GRAY2BGR)
+            gray_eye = gray[tly:bry, tlx:brx]
+            if stages is not None:
+                stages.append(gray_eye)
 
-            disp = np.hstack((eye_copy, gray_eye_disp, thresh_disp,
-                              no_eyelash, eroded))
+            thresh = self.__threshold_eye(gray_eye, rel_eye_points, stages,
+                                          self.__pool)
 
-            return (tl, br, thresh), disp
-        except:
+            return tl, br, thresh
+        except (cv2.error, ValueError):
             pass
 
-        return (tl, br, None), None
+        return tl, br, None
 
     def __check_hist(self, eye):
         if eye is None:
             return 1
 
-        h, w = eye.shape
-        return 1 - (len(eye.nonzero()[0]) / (h * w))
+        return 1 - cv2.countNonZero(eye) / eye.size
 
     def __is_closed(self, hist, other):
-        return _EYE_DIFF_THRESH * hist < other or hist < _EYE_HIST_THRESH
+        return self.__diff_thresh * hist < other or \
+            hist < self.__hist_thresh
 
-    def leaning(self):
-        l_tl, l_br, __ = self.__l_rect
-        r_tl, r_br, __ = self.__r_rect
+    def __mosaic(self, eye_points, box, frame):
+        """Stages of the eye transformation stacked horizontally."""
+        if self.__gray is None:
+            return None
+
+        tlx, tly, brx, bry = (int(v) for v in box)
+
+        stages = []
+        self.__find_eye_roi(eye_points, box, self.__gray, stages)
+        if len(stages) < 4:
+            return None
 
-        ly = l_br[1] - 0.5 * l_tl[1]
-        ry = r_br[1] - 0.5 * r_tl[1]
+        eye = frame[tly:bry, tlx:brx].copy()
+        disp = [cv2.cvtColor(s, cv2.COLOR_GRAY2BGR) for s in stages]
 
-        return abs(ly - ry) > _LEAN_THRESH
+        return np.hstack([eye] + disp)
+
+    def hists(self):
+        """Left and right eye histograms."""
+        return self.__l_hist, self.__r_hist
+
+    def leaning(self):
+        return self.__lean > self.__lean_thresh
 
     def left_blink(self):
         return self.__l_closed
@@ -157,14 +230,18 @@ class Eyes():
         align_x = int(w * 0.63)
         align_y = int(h * 0.1)
 
+        # Built here rather than per frame: nothing else needs the stages.
+        l_disp = self.__mosaic(self.__left_eye, self.__l_box, frame)
+        r_disp = self.__mosaic(self.__right_eye, self.__r_box, frame)
+
         l_tl, l_br = self.__l_rect[0:2]
         r_tl, r_br = self.__r_rect[0:2]
 
         cv2.rectangle(frame, l_tl, l_br, (0, 255 ,0), 2)
         cv2.rectangle(frame, r_tl, r_br, (0, 255, 0), 2)
 
-        l_cnt = cv2.convexHull(self.__left_eye)
-        r_cnt = cv2.convexHull(self.__right_eye)
+        l_cnt = cv2.convexHull(self.__left_eye.astype(np.int32))
+        r_cnt = cv2.convexHull(self.__right_eye.astype(np.int32))
 
         cv2.drawContours(frame, [l_cnt], -1, (0, 255, 0), 2)
         cv2.drawContours(frame, [r_cnt], -1, (0, 255, 0), 2)
@@ -175,14 +252,59 @@ class Eyes():
                  (align_x, align_y + 2 * 20))
 
         l_disp_y = 0
-        if self.__l_disp is not None:
-            l_disp_y, l_disp_x, _ = self.__l_disp.shape
+        if l_disp is not None:
+            l_disp_y, l_disp_x, _ = l_disp.shape
 
             if l_disp_x < w:
-                frame[0:l_disp_y, 0:l_disp_x] = self.__l_disp
+                frame[0:l_disp_y, 0:l_disp_x] = l_disp
 
-        if self.__r_disp is not None:
-            r_disp_y, r_disp_x, _ = self.__r_disp.shape
+        if r_disp is not None:
+            r_disp_y, r_disp_x, _ = r_disp.shape
             if l_disp_y >= w:
                 return
-            frame[l_disp_y:(l_disp_y + r_disp_y), 0:r_disp_x] = self.__r_disp
+            frame[l_disp_y:(l_disp_y + r_disp_y), 0:r_disp_x] = r_disp
+
+
+def aspect_closed(features):
+    """(left, right) closed states from the eye aspect ratios alone."""
+    return float(features.l_aspect) < _ASPECT_THRESH, \
+        float(features.r_aspect) < _ASPECT_THRESH
+
+
+class AspectGate():
+    """Decides eye states from the landmarks alone when they are clear.
+
+    An eye is closed when its aspect ratio (features._aspect) is below
+    _ASPECT_THRESH. When either eye is within margin of it the face is
+    handed to the histogram pipeline of Eyes instead, but only while the
+    share of faces handed over stays below max_fallback; past that the
+    aspect ratio decides anyway.
+    """
+    def __init__(self, max_fallback=_MAX_FALLBACK, margin=_ASPECT_MARGIN):
+        self.__max_fallback = max_fallback
+        self.__margin = margin
+
+        self.faces = 0
+        self.fallbacks = 0
+
+    def closed(self, features):
+        """
+        Args:
+            features: features.Features of a single face.
+        Returns:
+            (left, right) closed states, or None to fall back to Eyes.
+        """
+        self.faces += 1
+
+        l, r = float(features.l_aspect), float(features.r_aspect)
+        ambiguous = abs(l - _ASPECT_THRESH) < self.__margin or \
+            abs(r - _ASPECT_THRESH) < self.__margin
+
+        if ambiguous and self.fallbacks < self.__max_fallback * self.faces:
+            self.fallbacks += 1
+            return None
+
+        return aspect_closed(features)
+
+    def fallback_rate(self):
+        return self.fallbacks / self.faces if self.faces else 0.0
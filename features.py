@@ -0,0 +1,102 @@
+import numpy as np
+
+from collections import namedtuple
+
+""" Landmark indices """
+LEFT_EAR = 1
+RIGHT_EAR = 16
+CHIN = 8
+NOSE_TIP = 30
+LEFT_EYE = slice(36, 42)
+RIGHT_EYE = slice(42, 48)
+
+_EYE_RECT_MODIFIER = 7
+
+Features = namedtuple("Features", [
+    "left_ear",     # (..., 2) landmark 1.
+    "right_ear",    # (..., 2) landmark 16.
+    "chin",         # (..., 2) landmark 8.
+    "nose_tip",     # (..., 2) landmark 30.
+    "head",         # (..., 2) midpoint of the ears.
+    "left_mid",     # (..., 2) midpoint of the left ear and head center.
+    "right_mid",    # (..., 2) midpoint of the right ear and head center.
+    "nc_ratio",     # (...,) nose-head / nose-chin distance, 2 decimals.
+    "zoom_ratio",   # (...,) ear to ear distance / frame width.
+    "left_eye",     # (..., 6, 2) landmarks 36-41.
+    "right_eye",    # (..., 6, 2) landmarks 42-47.
+    "l_box",        # (..., 4) left eye ROI as tlx, tly, brx, bry.
+    "r_box",        # (..., 4) right eye ROI as tlx, tly, brx, bry.
+    "lean",         # (...,) vertical offset between the two eye ROIs.
+    "l_aspect",     # (...,) left eye aspect ratio.
+    "r_aspect",     # (...,) right eye aspect ratio.
+])
+
+
+def _eye_box(eye):
+    """ROI around the eye points, padded by _EYE_RECT_MODIFIER."""
+    return np.stack([eye[..., 0, 0] - _EYE_RECT_MODIFIER,
+                     eye[..., 1, 1] - _EYE_RECT_MODIFIER,
+                     eye[..., 3, 0] + _EYE_RECT_MODIFIER,
+                     eye[..., 4, 1] + _EYE_RECT_MODIFIER], axis=-1)
+
+
+def _aspect(eye):
+    """Eyelid gap over eye width; drops towards 0 as the eye closes.
+
+    source: http://vision.fe.uni-lj.si/cvww2016/proceedings/papers/05.pdf
+    """
+    gap = np.linalg.norm(eye[..., 1, :] - eye[..., 5, :], axis=-1) + \
+        np.linalg.norm(eye[..., 2, :] - eye[..., 4, :], axis=-1)
+    width = np.linalg.norm(eye[..., 0, :] - eye[..., 3, :], axis=-1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return gap / (2 * width)
+
+
+def extract_features(shape, width):
+    """Head and eye geometry from 68 point landmarks in one vectorized pass.
+
+    Args:
+        shape: (68, 2) landmarks of one face, or a stacked (F, 68, 2) batch
+               of several faces or a recorded sequence.
+        width: Width of the frame the landmarks were predicted on, either a
+               scalar or one value per face.
+    Returns:
+        Features whose fields carry the same leading dimensions as shape.
+    """
+    shape = np.asarray(shape)
+
+    left_ear = shape[..., LEFT_EAR, :]
+    right_ear = shape[..., RIGHT_EAR, :]
+    chin = shape[..., CHIN, :]
+    nose_tip = shape[..., NOSE_TIP, :]
+
+    head = (left_ear + right_ear) // 2
+    left_mid = (left_ear + head) // 2
+    right_mid = (right_ear + head) // 2
+
+    nose_head = np.linalg.norm(nose_tip - head, axis=-1)
+    nose_chin = np.linalg.norm(nose_tip - chin, axis=-1)
+    ear_ear = np.linalg.norm(right_ear - left_ear, axis=-1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        nc_ratio = np.round(nose_head / nose_chin, 2)
+        zoom_ratio = ear_ear / np.asarray(width)
+
+    left_eye = shape[..., LEFT_EYE, :]
+    right_eye = shape[..., RIGHT_EYE, :]
+    l_box = _eye_box(left_eye)
+    r_box = _eye_box(right_eye)
+
+    ly = l_box[..., 3] - 0.5 * l_box[..., 1]
+    ry = r_box[..., 3] - 0.5 * r_box[..., 1]
+
+    return Features(left_ear, right_ear, chin, nose_tip, head,
+                    left_mid, right_mid, nc_ratio, zoom_ratio,
+                    left_eye, right_eye, l_box, r_box, np.abs(ly - ry),
+                    _aspect(left_eye), _aspect(right_eye))
+
+
+def point(p):
+    """Integer tuple for OpenCV drawing functions."""
+    return int(p[0]), int(p[1])
@@ -1,6 +1,6 @@
 import cv2
-import math
 from utils import *
+from features import point
 
 UP_THRESH = 0.15      # Decrease to make it more sensitive.
 DOWN_THRESH = 0.5    # Decrease to make it more sensitive.
@@ -29,7 +29,7 @@ class Head():
     https://www.pyimagesearch.com/2017/04/17/real-time-facial-landmark-detection-opencv-python-dlib/
     """
 
-    def __init__(self, shape, width):
+    def __init__(self, features, thresholds=None):
         """
         Left Ear Index: 1.
         Right Ear Index: 16.
@@ -37,28 +37,35 @@ class Head():
         Nose Index: 30.
         Rightmost point in left eye Index: 39
         Leftmost point in left eye Index: 42
+
+        Args:
+            features: features.Features of a single face.
+            thresholds: Calibrated values of the calibrate.HEAD_RANGES
+                        thresholds; the module defaults if None.
         """
+        thresholds = thresholds or {}
+        self.__up_thresh = thresholds.get("UP_THRESH", UP_THRESH)
+        self.__down_thresh = thresholds.get("DOWN_THRESH", DOWN_THRESH)
+        self.__zoom_thresh = thresholds.get("ZOOM_THRESH", ZOOM_THRESH)
 
-        self.__left_ear = shape_coord(shape, 1)
-        self.__right_ear = shape_coord(shape, 16)
+        self.__left_ear = point(features.left_ear)
+        self.__right_ear = point(features.right_ear)
 
-        self.__chin = shape_coord(shape, 8)
-        self.__nose_tip = shape_coord(shape, 30)
-        self.__head = midpoint(self.__left_ear, self.__right_ear)
+        self.__chin = point(features.chin)
+        self.__nose_tip = point(features.nose_tip)
+        self.__head = point(features.head)
 
-        # Used in Down detection
-        # Get the vertical distance between the center of the head and the nose tip
-        # Get the vertical distance between the center of the head and the chin
-        # Take the ratio of those two distances
-        nose_head_dist = dist(self.__nose_tip, self.__head)
-        nose_chin_dist = dist(self.__nose_tip, self.__chin)
+        self.__left_mid = point(features.left_mid)
+        self.__right_mid = point(features.right_mid)
 
-        self.__nc_ratio = round(nose_head_dist / nose_chin_dist, 2)
+        # Used in Down detection
+        # Ratio of the nose tip to head center distance over the nose tip to
+        # chin distance.
+        self.__nc_ratio = float(features.nc_ratio)
 
         # Used in Up detection
-        # compure ratio of head width over frame width
-        self.__frame_width = width
-        self.__head_zoom_ratio = dist(self.__left_ear, self.__right_ear) / width
+        # Ratio of head width over frame width
+        self.__head_zoom_ratio = float(features.zoom_ratio)
 
     def turned_left(self):
         """Detects if the head is turned left.
@@ -66,10 +73,7 @@ class Head():
         Compares the nose point against the midpoint
         of the leftmost head point and head center
         """
-        nx, _ = self.__nose_tip
-        mx, _ = midpoint(self.__left_ear, self.__head)
-
-        return nx < mx
+        return self.__nose_tip[0] < self.__left_mid[0]
 
     def turned_right(self):
         """Detects if the head is turned right.
@@ -77,10 +81,7 @@ class Head():
         Compares the nose point against the midpoint
         of the rightmost head point and head center
         """
-        nx, _ = self.__nose_tip
-        mx, _ = midpoint(self.__right_ear, self.__head)
-
-        return nx > mx
+        return self.__nose_tip[0] > self.__right_mid[0]
 
     def turned_up(self):
         """Detects if the head is nodding up.
@@ -91,7 +92,7 @@ class Head():
         _, ny = self.__nose_tip
         _, hy = self.__head
 
-        return ny < hy and self.__nc_ratio > UP_THRESH
+        return ny < hy and self.__nc_ratio > self.__up_thresh
 
     def turned_down(self):
         """Detects if the head is nodding up.
@@ -103,14 +104,14 @@ class Head():
         _, ny = self.__nose_tip
         _, cy = self.__chin
 
-        return hy < ny and ny < cy and self.__nc_ratio > DOWN_THRESH
+        return hy < ny and ny < cy and self.__nc_ratio > self.__down_thresh
 
     def zoom(self):
         """Determines if the head is zommed in or not.
 
         Compares one's head width / frame width ratio to threshold
         """
-        return self.__head_zoom_ratio > ZOOM_THRESH
+        return self.__head_zoom_ratio > self.__zoom_thresh
 
     def debug(self, frame):
         h, w, _ = frame.shape
@@ -123,8 +124,8 @@ class Head():
         cv2.circle(frame, self.__chin, 3, 255, -1)
 
         # Left debugging
-        frame = draw_left_line(frame, midpoint(self.__left_ear, self.__head))
-        frame = draw_right_line(frame, midpoint(self.__right_ear, self.__head))
+        frame = draw_left_line(frame, self.__left_mid)
+        frame = draw_right_line(frame, self.__right_mid)
 
         nh_color = (255, 0, 0)
 
@@ -1,12 +1,16 @@
 import os
+import sys
 import json
 import time
+import threading
 import pyautogui
 
 from enum import Enum
+from collections import deque
 from action import HeadAction, EyeAction
 
 _SLEEP_DURATION = 0.2
+_EXECUTOR_QUEUE_SIZE = 4
 
 class Macro(Enum):
     MOVE_LEFT = 0
@@ -72,7 +76,8 @@ class MacroHandler():
         self.__macros[Macro.COPY] = ["command", "c"]
         self.__macros[Macro.PASTE] = ["command", "v"]
 
-    def execute(self, macro):
+    def inject(self, macro):
+        """Presses the hotkeys bound to macro without waiting afterwards."""
         if macro == Macro.NO_ACTION:
             return
 
@@ -81,4 +86,138 @@ class MacroHandler():
         pyautogui.hotkey("ctrl")
 
         pyautogui.hotkey(*hotkeys)
+
+    def execute(self, macro):
+        if macro == Macro.NO_ACTION:
+            return
+
+        self.inject(macro)
         time.sleep(_SLEEP_DURATION)
+
+
+class _Timing():
+    """Running count, mean and max of a duration in seconds."""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def as_dict(self):
+        mean = self.total / self.count if self.count else 0.0
+        return {"mean_ms": round(1000 * mean, 2),
+                "max_ms": round(1000 * self.max, 2)}
+
+
+class MacroExecutor(threading.Thread):
+    """Runs macros on a background thread so key injection never blocks capture.
+
+    submit() only appends to a small bounded queue and returns at once. When
+    the queue is full the oldest pending macro is dropped. A burst of the same
+    TAB_FORWARD/TAB_BACKWARD macro collapses into one pending entry, and
+    injections are spaced at least min_interval seconds apart, which replaces
+    the sleep in MacroHandler.execute. A macro that fails to inject, e.g.
+    one without a key binding, is reported and counted in failed, and the
+    executor carries on with the next.
+    """
+    COALESCED = (Macro.TAB_FORWARD, Macro.TAB_BACKWARD)
+
+    def __init__(self, handler, size=_EXECUTOR_QUEUE_SIZE,
+                 min_interval=_SLEEP_DURATION, metrics=None):
+        super().__init__(name="macro-executor", daemon=True)
+
+        self.__handler = handler
+        self.__metrics = metrics
+        self.__pending = deque()
+        self.__size = size
+        self.__min_interval = min_interval
+        self.__cond = threading.Condition()
+        self.__stopped = False
+
+        self.__queue_wait = _Timing()
+        self.__injection = _Timing()
+        self.__submitted = 0
+        self.__coalesced = 0
+        self.__dropped = 0
+        self.__failed = 0
+
+    def submit(self, macro):
+        if macro == Macro.NO_ACTION:
+            return
+
+        with self.__cond:
+            self.__submitted += 1
+
+            if macro in self.COALESCED and self.__pending \
+                    and self.__pending[-1][0] == macro:
+                self.__coalesced += 1
+                return
+
+            if len(self.__pending) >= self.__size:
+                self.__pending.popleft()
+                self.__dropped += 1
+
+            self.__pending.append((macro, time.monotonic()))
+            self.__cond.notify()
+
+    def run(self):
+        last = -self.__min_interval
+
+        while True:
+            with self.__cond:
+                while not self.__pending and not self.__stopped:
+                    self.__cond.wait()
+
+                if not self.__pending:
+                    return
+
+                macro, submitted = self.__pending.popleft()
+
+            wait = last + self.__min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            start = time.monotonic()
+            try:
+                self.__handler.inject(macro)
+            except Exception as e:
+                print("macro {} failed: {!r}".format(macro.name, e),
+                      file=sys.stderr)
+                with self.__cond:
+                    self.__failed += 1
+                last = time.monotonic()
+                continue
+            last = time.monotonic()
+
+            with self.__cond:
+                self.__queue_wait.add(start - submitted)
+                self.__injection.add(last - start)
+
+            if self.__metrics is not None and self.__metrics.enabled:
+                # Runs beside the frames, so kept out of the frame breakdown.
+                self.__metrics.observe("macro", last - start, frame=False)
+
+    def stop(self):
+        """Stops after the macros already queued have run."""
+        with self.__cond:
+            self.__stopped = True
+            self.__cond.notify()
+
+        self.join()
+
+    def stats(self):
+        with self.__cond:
+            return {
+                "submitted": self.__submitted,
+                "executed": self.__injection.count,
+                "coalesced": self.__coalesced,
+                "dropped": self.__dropped,
+                "failed": self.__failed,
+                "pending": len(self.__pending),
+                "queue_wait": self.__queue_wait.as_dict(),
+                "injection": self.__injection.as_dict(),
+            }
@@ -1,7 +1,17 @@
+import os
 import argparse
 
-from capture import capture_action
-from macro import MacroHandler, translate_action
+from capture import capture_action, ActionStream, stop_on_signals
+from tracking import TRACK_MODES, TRACK_CORRELATION, SELECT_POLICIES, \
+    SELECT_STICKY
+from detectors import DETECT_SCALES, DETECTORS, DETECTOR_HOG
+from sources import open_source, CameraConfig, WebcamSource
+from calibrate import PROFILE_PATH
+from broadcast import ActionBroadcaster
+from metrics import MetricsRegistry, MetricsExporter, FORMATS, FORMAT_JSON
+from profiling import ProfileWindow, SlowFrameDumper
+from scheduler import IDLE_AFTER, IDLE_FPS
+from macro import MacroHandler, MacroExecutor, translate_action
 
 _MACROS = '~/Library/Application Support/Spectacle/Shortcuts.json'
 
@@ -15,22 +25,204 @@ ap.add_argument("-d", "--debug", action="store_true", required=False,
                 help="Displays debugging information.")
 ap.add_argument("-l", "--log", action="store_true", required=False,
                 help="Displays logging information.")
+ap.add_argument("--pipelined", action="store_true", required=False,
+                help="Reads the camera and dispatches actions on separate "
+                     "threads, always processing the newest frame.")
+ap.add_argument("--redetect-interval", type=int, default=1, required=False,
+                help="Runs the face detector every N frames and tracks the "
+                     "face in between. 1 detects on every frame.")
+ap.add_argument("--track-mode", choices=TRACK_MODES,
+                default=TRACK_CORRELATION, required=False,
+                help="How faces are tracked between detections.")
+ap.add_argument("--detect-scale", type=float, choices=DETECT_SCALES,
+                default=1.0, required=False,
+                help="Runs the face detector on a frame downscaled by this "
+                     "factor. Landmarks are still predicted at full size.")
+ap.add_argument("--detector", choices=DETECTORS, default=DETECTOR_HOG,
+                required=False,
+                help="Face detector backend. The cascades are cheaper than "
+                     "HOG; hybrid only runs HOG when the cascade misses.")
+ap.add_argument("--cascade", required=False,
+                help="Cascade file for the haar, lbp and hybrid detectors "
+                     "instead of the one installed with OpenCV.")
+ap.add_argument("--fast-eyes", type=float, required=False,
+                metavar="MAX_FALLBACK",
+                help="Decides eye states from the landmarks and only runs "
+                     "the pixel based eye pipeline on ambiguous faces, for "
+                     "at most this share of them, e.g. 0.2.")
+ap.add_argument("--smooth", action="store_true", required=False,
+                help="Smooths the landmarks over time to steady the "
+                     "head/eye classifications.")
+ap.add_argument("--predictor-interval", type=int, default=1, required=False,
+                help="Runs the landmark predictor at least every N frames "
+                     "and predicts the landmarks of a still face in between. "
+                     "Implies --smooth.")
+ap.add_argument("-s", "--source", default="0", required=False,
+                help="Camera index, video file, image directory or .npz "
+                     "landmark recording to read frames from.")
+ap.add_argument("--count-frames", action="store_true", required=False,
+                help="Confirms gestures by frame count instead of by frame "
+                     "timestamps.")
+ap.add_argument("--calibration", default=PROFILE_PATH, required=False,
+                help="Calibration profile with the Head/Eyes thresholds, "
+                     "see calibrate.py. Ignored if it does not exist.")
+ap.add_argument("--no-calibration", action="store_true", required=False,
+                help="Uses the default Head/Eyes thresholds even if there "
+                     "is a calibration profile.")
+ap.add_argument("-r", "--record", required=False,
+                help="Records landmarks, eye histograms and decisions of "
+                     "every frame to this session file.")
+ap.add_argument("--face-policy", choices=SELECT_POLICIES,
+                default=SELECT_STICKY, required=False,
+                help="Which detected face drives the actions. \"all\" "
+                     "processes every face with its own gesture state.")
+ap.add_argument("--idle-after", type=float, default=IDLE_AFTER,
+                required=False,
+                help="Seconds without a face before capture slows down to "
+                     "--idle-fps. 0 never idles.")
+ap.add_argument("--idle-fps", type=float, default=IDLE_FPS, required=False,
+                help="Frame rate while idle.")
+ap.add_argument("--serve", required=False, metavar="SOCKET",
+                help="Runs as a daemon that broadcasts every action to the "
+                     "subscribers of this UNIX socket, see broadcast.py.")
+ap.add_argument("--serve-raw", action="store_true", required=False,
+                help="Also broadcasts the head/eye classification of every "
+                     "frame.")
+ap.add_argument("--width", type=int, required=False,
+                help="Requested camera frame width.")
+ap.add_argument("--height", type=int, required=False,
+                help="Requested camera frame height.")
+ap.add_argument("--fps", type=float, required=False,
+                help="Requested camera frame rate.")
+ap.add_argument("--fourcc", required=False,
+                help="Requested camera pixel format, e.g. MJPG.")
+ap.add_argument("--buffersize", type=int, required=False,
+                help="Frames the camera driver may queue. 1 keeps latency "
+                     "lowest.")
+ap.add_argument("--hw-crop", action="store_true", required=False,
+                help="Has the camera deliver only the middle half of the "
+                     "columns, where the backend supports it.")
+ap.add_argument("--metrics", required=False, metavar="TARGET",
+                help="Exports stage latency histograms and counters to this "
+                     "file, or to a UNIX datagram socket given as "
+                     "unix:PATH. Stage timing is off without it.")
+ap.add_argument("--metrics-format", choices=FORMATS, default=FORMAT_JSON,
+                required=False, help="Format of the exported metrics.")
+ap.add_argument("--metrics-interval", type=float, default=10.0,
+                required=False, help="Seconds between metrics exports.")
+ap.add_argument("--profile", type=float, required=False, metavar="SECONDS",
+                help="Profiles the first SECONDS of capture with cProfile "
+                     "and writes the stats to --profile-dir.")
+ap.add_argument("--slow-frame-ms", type=float, required=False,
+                help="Dumps every frame slower than this, with its stage "
+                     "breakdown and landmarks, to --profile-dir.")
+ap.add_argument("--profile-dir", default="profile", required=False,
+                help="Where --profile and --slow-frame-ms write to.")
 args = vars(ap.parse_args())
 
+if args["serve"] and (args["profile"] or args["slow_frame_ms"] is not None):
+    ap.error("--profile and --slow-frame-ms only work without --serve")
+
 
 def main():
     pred_path = args["shape_predictor"]
     enable_macros = args["macros"]
-    macro_handler = MacroHandler(_MACROS)
+
+    # Slow frame dumps need the stage timings too.
+    metrics = MetricsRegistry(enabled=args["metrics"] is not None
+                              or args["slow_frame_ms"] is not None)
+    exporter = None
+    if args["metrics"] is not None:
+        exporter = MetricsExporter(metrics, args["metrics"],
+                                   args["metrics_format"],
+                                   args["metrics_interval"])
+        exporter.start()
+
+    macro_executor = MacroExecutor(MacroHandler(_MACROS), metrics=metrics)
+    macro_executor.start()
 
     def trigger_macro(action):
         nonlocal enable_macros
 
         if enable_macros:
             macro = translate_action(action)
-            macro_handler.execute(macro)
+            macro_executor.submit(macro)
+
+    calibration = None if args["no_calibration"] else args["calibration"]
+    options = dict(redetect_interval=args["redetect_interval"],
+                   track_mode=args["track_mode"],
+                   detect_scale=args["detect_scale"],
+                   count_frames=args["count_frames"],
+                   profile=calibration,
+                   face_policy=args["face_policy"],
+                   metrics=metrics,
+                   detector=args["detector"],
+                   cascade=args["cascade"],
+                   eye_fallback=args["fast_eyes"],
+                   smooth=args["smooth"],
+                   predictor_interval=args["predictor_interval"])
+
+    source = open_capture_source()
+
+    profiler, slow_frames = None, None
+    if args["profile"]:
+        profiler = ProfileWindow(args["profile"],
+                                 os.path.join(args["profile_dir"],
+                                              "capture.prof"))
+    if args["slow_frame_ms"] is not None:
+        slow_frames = SlowFrameDumper(args["profile_dir"],
+                                      args["slow_frame_ms"] / 1000)
+
+    if args["serve"]:
+        serve(ActionStream(pred_path, source, args["pipelined"],
+                           args["record"], args["idle_after"],
+                           args["idle_fps"], **options),
+              trigger_macro)
+    else:
+        capture_action(pred_path, trigger_macro, args["debug"], args["log"],
+                       args["pipelined"], source, args["record"],
+                       args["idle_after"], args["idle_fps"],
+                       profiler=profiler, slow_frames=slow_frames, **options)
+
+    macro_executor.stop()
+
+    if exporter is not None:
+        exporter.stop()
+
+    if args["log"]:
+        print(macro_executor.stats())
+
+def open_capture_source():
+    """Opens the source with the requested camera mode and reports it."""
+    config = CameraConfig(args["width"], args["height"], args["fps"],
+                          args["fourcc"], args["buffersize"], args["hw_crop"])
+    source = open_source(args["source"], config)
+
+    if isinstance(source, WebcamSource):
+        mode = source.mode()
+        mode["delivered_fps"] = round(source.probe(), 1)
+        print("camera: {}".format(mode))
+
+    return source
+
+
+def serve(stream, cb):
+    """Runs the capture pipeline once for every local subscriber."""
+    broadcaster = ActionBroadcaster(args["serve"], args["serve_raw"])
+    broadcaster.start()
+
+    try:
+        with stop_on_signals(stream.stop), stream:
+            for event in stream:
+                broadcaster.publish(event)
+
+                if event.action is not None:
+                    cb(event.action)
+    finally:
+        broadcaster.stop()
 
-    capture_action(pred_path, trigger_macro, args["debug"], args["log"])
+    if args["log"]:
+        print(broadcaster.stats())
 
 if __name__ == "__main__":
     main()
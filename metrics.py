@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import socket
+import bisect
+import threading
+
+from collections import OrderedDict
+
+FORMAT_JSON = "json"
+FORMAT_PROMETHEUS = "prometheus"
+FORMATS = (FORMAT_JSON, FORMAT_PROMETHEUS)
+
+SOCKET_PREFIX = "unix:"
+
+# Upper bounds in seconds; anything slower lands in the +Inf bucket.
+_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+            1.0)
+_EXPORT_INTERVAL = 10.0
+_PREFIX = "kender"
+
+
+class Histogram():
+    """Fixed bucket latency histogram; observe() is a bisect and two adds."""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+
+class MetricsRegistry():
+    """Stage latency histograms and event counters of the capture pipeline.
+
+    Stages are timed with lap(), which records the time since the previous
+    lap and returns the new lap start:
+
+        t = metrics.clock()
+        preprocess(...)
+        t = metrics.lap("preprocess", t)
+
+    When disabled, clock() and lap() return at once without reading the
+    clock, so instrumented code costs a method call per stage. Counters are
+    always kept; they are cheap and the --log and debug output uses them.
+
+    While enabled, the stage times of the frame in flight are also kept in
+    frame, cleared by begin_frame(). Stages timed on other threads, like
+    macro injection, pass frame=False so only their histogram is updated.
+
+    Writers are not locked. A snapshot taken on another thread may be a
+    frame out of date, never corrupt.
+    """
+    def __init__(self, enabled=True, buckets=_BUCKETS):
+        self.enabled = enabled
+
+        self.__buckets = buckets
+        self.__histograms = OrderedDict()
+        self.__counters = OrderedDict()
+
+        self.frame = OrderedDict()
+
+    def begin_frame(self):
+        if self.enabled:
+            self.frame.clear()
+
+    def clock(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    def lap(self, stage, start):
+        """Records the time since start under stage.
+
+        Returns:
+            The current time, the start of the next stage.
+        """
+        if not self.enabled:
+            return 0.0
+
+        now = time.perf_counter()
+        self.observe(stage, now - start)
+
+        return now
+
+    def observe(self, stage, seconds, frame=True):
+        """Records seconds under stage.
+
+        Args:
+            frame: Also adds seconds to the frame in flight; only the
+                   thread running the frames may do that.
+        """
+        histogram = self.__histograms.get(stage)
+        if histogram is None:
+            histogram = self.__histograms[stage] = Histogram(self.__buckets)
+
+        histogram.observe(seconds)
+        if frame:
+            self.frame[stage] = self.frame.get(stage, 0.0) + seconds
+
+    def inc(self, name, label, n=1):
+        """Adds n to the counter of label, e.g. an action, within name."""
+        counter = self.__counters.get(name)
+        if counter is None:
+            counter = self.__counters[name] = OrderedDict()
+
+        counter[label] = counter.get(label, 0) + n
+
+    def counts(self, name):
+        """Label to count of one counter."""
+        return self.__counters.get(name, OrderedDict())
+
+    def means(self):
+        """Mean latency of every stage in milliseconds."""
+        return OrderedDict((stage, round(1000 * h.mean(), 3))
+                           for stage, h in list(self.__histograms.items()))
+
+    def snapshot(self):
+        """JSON serializable copy of every histogram and counter."""
+        return {
+            "histograms": {
+                stage: {"buckets": list(h.buckets), "counts": list(h.counts),
+                        "sum": h.sum, "count": h.count}
+                for stage, h in list(self.__histograms.items())},
+            "counters": {
+                name: {str(label): n for label, n in list(counter.items())}
+                for name, counter in list(self.__counters.items())},
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self):
+        """Snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+
+        name = _PREFIX + "_stage_seconds"
+        lines.append("# TYPE {} histogram".format(name))
+        for stage, h in snapshot["histograms"].items():
+            total = 0
+            bounds = [str(b) for b in h["buckets"]] + ["+Inf"]
+            for le, n in zip(bounds, h["counts"]):
+                total += n
+                lines.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(
+                    name, stage, le, total))
+            lines.append('{}_sum{{stage="{}"}} {}'.format(name, stage,
+                                                         h["sum"]))
+            lines.append('{}_count{{stage="{}"}} {}'.format(name, stage,
+                                                           h["count"]))
+
+        for counter, values in snapshot["counters"].items():
+            name = "{}_{}_total".format(_PREFIX, counter)
+            lines.append("# TYPE {} counter".format(name))
+            for label, n in values.items():
+                lines.append('{}{{label="{}"}} {}'.format(name, label, n))
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter(threading.Thread):
+    """Writes registry snapshots out every interval seconds.
+
+    A target starting with SOCKET_PREFIX is a UNIX datagram socket that gets
+    each snapshot as one datagram; a collector that is not listening only
+    costs a failed send. Any other target is a file, replaced atomically so
+    readers never see half a snapshot.
+    """
+    def __init__(self, registry, target, fmt=FORMAT_JSON,
+                 interval=_EXPORT_INTERVAL):
+        super().__init__(name="metrics-exporter", daemon=True)
+
+        self.__registry = registry
+        self.__target = target
+        self.__fmt = fmt
+        self.__interval = interval
+        self.__stop = threading.Event()
+
+        self.exports = 0
+        self.failures = 0
+
+    def __render(self):
+        if self.__fmt == FORMAT_PROMETHEUS:
+            return self.__registry.to_prometheus()
+
+        return self.__registry.to_json()
+
+    def export(self):
+        data = self.__render().encode()
+
+        try:
+            if self.__target.startswith(SOCKET_PREFIX):
+                path = self.__target[len(SOCKET_PREFIX):]
+                with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as s:
+                    s.sendto(data, path)
+            else:
+                tmp = self.__target + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, self.__target)
+        except OSError:
+            self.failures += 1
+            return
+
+        self.exports += 1
+
+    def run(self):
+        while not self.__stop.wait(self.__interval):
+            self.export()
+
+    def stop(self):
+        """Stops after one last export."""
+        self.__stop.set()
+        self.join()
+        self.export()
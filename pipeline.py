@@ -0,0 +1,170 @@
+import queue
+import threading
+import time
+
+from collections import deque
+
+_RING_SIZE = 2
+_DISPATCH_QUEUE_SIZE = 8
+_READ_RETRY_DELAY = 0.005
+_POP_TIMEOUT = 0.5
+
+
+class FrameRing():
+    """Bounded ring holding only the newest captured frames.
+
+    The camera reader pushes into the ring without ever blocking. Once the
+    ring is full the oldest frame is overwritten. The processing stage always
+    takes the freshest frame and discards anything older, so a slow frame
+    never delays the ones behind it.
+    """
+    def __init__(self, size=_RING_SIZE):
+        self.__frames = deque(maxlen=size)
+        self.__cond = threading.Condition()
+        self.__closed = False
+
+        self.pushed = 0
+        self.dropped = 0
+
+    def push(self, frame, timestamp):
+        with self.__cond:
+            if len(self.__frames) == self.__frames.maxlen:
+                self.dropped += 1
+
+            self.__frames.append((frame, timestamp))
+            self.pushed += 1
+            self.__cond.notify()
+
+    def pop_latest(self, timeout=_POP_TIMEOUT):
+        """Takes the newest frame and drops every stale one.
+
+        Returns:
+            (frame, timestamp), or (None, None) if nothing arrived in time or
+            the ring was closed.
+        """
+        with self.__cond:
+            if not self.__frames and not self.__closed:
+                self.__cond.wait(timeout)
+
+            if not self.__frames:
+                return None, None
+
+            frame, timestamp = self.__frames.pop()
+            self.dropped += len(self.__frames)
+            self.__frames.clear()
+
+            return frame, timestamp
+
+    def depth(self):
+        with self.__cond:
+            return len(self.__frames)
+
+    def close(self):
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify_all()
+
+
+class CameraReader(threading.Thread):
+    """Producer stage: reads a frame source as fast as it delivers frames.
+
+    With a scheduler.AdaptiveScheduler the reads are spaced by its period,
+    so an idle stream does not keep capturing at the full camera rate.
+    """
+    def __init__(self, source, ring, scheduler=None):
+        super().__init__(name="camera-reader", daemon=True)
+
+        self.__source = source
+        self.__ring = ring
+        self.__scheduler = scheduler
+        self.__stop = threading.Event()
+
+    def run(self):
+        last = None
+
+        while not self.__stop.is_set() and not self.__source.exhausted:
+            period = self.__scheduler.period if self.__scheduler else 0.0
+            if period and last is not None:
+                delay = last + period - time.monotonic()
+                if delay > 0 and self.__stop.wait(delay):
+                    break
+
+            frame = self.__source.read()
+
+            if frame is None:
+                time.sleep(_READ_RETRY_DELAY)
+                continue
+
+            last = time.monotonic()
+            self.__ring.push(frame, frame.timestamp)
+
+        self.__ring.close()
+
+    def stop(self):
+        self.__stop.set()
+        self.join()
+
+
+class ActionDispatcher(threading.Thread):
+    """Dispatch stage: runs the action callback off the processing thread.
+
+    Submitting never blocks. If the callback falls so far behind that the
+    queue fills up, the oldest pending action is dropped.
+    """
+    def __init__(self, cb, size=_DISPATCH_QUEUE_SIZE):
+        super().__init__(name="action-dispatcher", daemon=True)
+
+        self.__cb = cb
+        self.__queue = queue.Queue(maxsize=size)
+
+        self.dropped = 0
+
+    def submit(self, action):
+        while True:
+            try:
+                self.__queue.put_nowait(action)
+                return
+            except queue.Full:
+                try:
+                    self.__queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def depth(self):
+        return self.__queue.qsize()
+
+    def run(self):
+        while True:
+            action = self.__queue.get()
+            if action is None:
+                return
+
+            self.__cb(action)
+
+    def stop(self):
+        self.__queue.put(None)
+        self.join()
+
+
+def pipeline_stats(ring=None, dispatcher=None):
+    """Per-stage queue depth and drop counters.
+
+    Args:
+        ring: FrameRing between the camera reader and the processing stage.
+        dispatcher: ActionDispatcher fed by the processing stage.
+    Returns:
+        Dictionary of statistics of the stages given.
+    """
+    stats = {}
+
+    if ring is not None:
+        stats["capture_depth"] = ring.depth()
+        stats["frames_captured"] = ring.pushed
+        stats["frames_dropped"] = ring.dropped
+
+    if dispatcher is not None:
+        stats["dispatch_depth"] = dispatcher.depth()
+        stats["actions_dropped"] = dispatcher.dropped
+
+    return stats
@@ -0,0 +1,117 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+
+import cv2
+
+from concurrent.futures import ThreadPoolExecutor
+
+_TOP_FUNCTIONS = 25
+_MAX_DUMPS = 100
+
+
+class ProfileWindow():
+    """Runs cProfile over the first seconds of capture.
+
+    tick() is called once per frame on the thread doing the processing, since
+    cProfile only sees the thread it was enabled on. The window opens on the
+    first tick; when it closes the stats are written to path and the top
+    functions by cumulative time are printed.
+    """
+    def __init__(self, seconds, path):
+        self.__seconds = seconds
+        self.__path = path
+        self.__profile = cProfile.Profile()
+        self.__until = None
+
+        self.done = False
+
+    def tick(self):
+        if self.done:
+            return
+
+        if self.__until is None:
+            self.__until = time.monotonic() + self.__seconds
+            self.__profile.enable()
+        elif time.monotonic() >= self.__until:
+            self.close()
+
+    def close(self):
+        """Ends the window early, e.g. when capture stops inside it."""
+        if self.done or self.__until is None:
+            return
+
+        self.__profile.disable()
+        self.done = True
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.__path)),
+                    exist_ok=True)
+        self.__profile.dump_stats(self.__path)
+
+        out = io.StringIO()
+        stats = pstats.Stats(self.__profile, stream=out)
+        stats.sort_stats("cumulative").print_stats(_TOP_FUNCTIONS)
+        print("profile written to {}\n{}".format(self.__path, out.getvalue()))
+
+
+class SlowFrameDumper():
+    """Saves every frame that took longer than threshold seconds.
+
+    A slow frame leaves slow_<index>.png, the captured frame, and
+    slow_<index>.json with its latency, stage breakdown and landmarks in
+    directory. The PNGs replay with replay.py -i directory. Files are written
+    on a worker thread so dumping does not slow down the frames after it,
+    and at most max_dumps frames are kept.
+    """
+    def __init__(self, directory, threshold, max_dumps=_MAX_DUMPS):
+        self.__directory = directory
+        self.__threshold = threshold
+        self.__max_dumps = max_dumps
+        self.__writer = ThreadPoolExecutor(1, "slow-frame-dumper")
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.dumps = 0
+
+    def check(self, frame, faces, latency, stages):
+        """
+        Args:
+            frame: sources.Frame as captured, checked before the next frame
+                   is read.
+            faces: capture.FaceResult list of the frame.
+            latency: Capture to result time in seconds.
+            stages: Stage name to seconds, see metrics.MetricsRegistry.frame.
+        """
+        if latency < self.__threshold or self.dumps >= self.__max_dumps:
+            return
+
+        self.dumps += 1
+
+        report = {
+            "index": frame.index,
+            "timestamp": frame.timestamp,
+            "latency_ms": round(1000 * latency, 3),
+            "stages_ms": {k: round(1000 * v, 3) for k, v in stages.items()},
+            "faces": [{"face_id": f.face_id, "landmarks": f.shape.tolist(),
+                       "head": str(f.head_action), "eye": str(f.eye_action)}
+                      for f in faces],
+        }
+        # The image stays valid only until the stream reads the next frame
+        # (see capture.ActionStream.frames), so write out a copy.
+        image = frame.image.copy() if frame.image is not None else None
+
+        self.__writer.submit(self.__write, frame.index, report, image)
+
+    def __write(self, index, report, image):
+        base = os.path.join(self.__directory, "slow_{:06d}".format(index))
+
+        if image is not None:
+            cv2.imwrite(base + ".png", image)
+        with open(base + ".json", "w") as f:
+            json.dump(report, f, indent=2)
+
+    def close(self):
+        self.__writer.shutdown()
@@ -0,0 +1,165 @@
+import os
+import queue
+import struct
+import threading
+
+import numpy as np
+
+_MAGIC = b"KSESSION"
+_VERSION = 1
+_HEADER = struct.Struct("<8sIII44x")    # magic, version, width, record size.
+_CHUNK_RECORDS = 256
+_QUEUE_RECORDS = 4 * _CHUNK_RECORDS
+_STOP_POLL = 0.1
+
+SESSION_EXT = ".kses"
+
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("rect", "<i4", (4,)),          # left, top, right, bottom.
+    ("landmarks", "<i2", (68, 2)),
+    ("l_hist", "<f4"),
+    ("r_hist", "<f4"),
+    ("eye", "u1"),                  # EyeAction value.
+    ("head", "u1"),                 # HeadAction value.
+    ("present", "u1"),              # 0, and all else 0, without a face.
+])
+
+
+class SessionRecorder(threading.Thread):
+    """Appends one fixed size record per frame to a binary session file.
+
+    The file is a 64 byte header followed by RECORD_DTYPE records, so it can
+    be memory mapped straight back into a structured array (see
+    load_recording). record() only queues a tuple; the records are packed
+    into chunks and written on this thread, and each chunk is flushed as it
+    fills, so a crash loses at most one chunk. The header, frame width
+    included, is complete from the first record on.
+
+    At most size records wait in the queue. If the disk falls that far
+    behind, further records are dropped and counted in dropped rather than
+    piling up in memory; the timestamps of the remaining records show the
+    gap.
+
+    start() creates the file, so a path that cannot be written raises there.
+    """
+    def __init__(self, path, chunk=_CHUNK_RECORDS, size=_QUEUE_RECORDS):
+        super().__init__(name="session-recorder", daemon=True)
+
+        self.__path = path
+        self.__queue = queue.Queue(maxsize=size)
+        self.__chunk = np.zeros(chunk, dtype=RECORD_DTYPE)
+        self.__file = None
+
+        self.records = 0
+        self.dropped = 0
+
+    def record(self, timestamp, width, face=None):
+        """Queues the record of one frame.
+
+        Args:
+            timestamp: Frame time in seconds.
+            width: Width of the processed frame.
+            face: capture.FaceResult of the recorded face, None if there was
+                  no face in the frame.
+        """
+        try:
+            self.__queue.put_nowait((timestamp, width, face))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        self.__file = open(self.__path, "wb")
+        self.__file.write(_HEADER.pack(_MAGIC, _VERSION, 0,
+                                       RECORD_DTYPE.itemsize))
+
+        super().start()
+
+    def run(self):
+        with self.__file as f:
+            n, width = 0, None
+            while True:
+                item = self.__queue.get()
+
+                if item is not None:
+                    if width is None:
+                        # Nothing but the header is written yet.
+                        width = item[1]
+                        f.seek(0)
+                        f.write(_HEADER.pack(_MAGIC, _VERSION, width,
+                                             RECORD_DTYPE.itemsize))
+                    self.__fill(self.__chunk[n], *item)
+                    n += 1
+
+                if n and (item is None or n == len(self.__chunk)):
+                    self.__chunk[:n].tofile(f)
+                    f.flush()
+                    self.records += n
+                    n = 0
+
+                if item is None:
+                    break
+
+    @staticmethod
+    def __fill(rec, timestamp, width, face):
+        rec["timestamp"] = timestamp
+
+        if face is None:
+            # Chunk slots are reused, so clear everything but the time.
+            for field in RECORD_DTYPE.names[1:]:
+                rec[field] = 0
+            return
+
+        if face.rect is not None:
+            r = face.rect
+            rec["rect"] = (r.left(), r.top(), r.right(), r.bottom())
+        else:
+            rec["rect"] = 0
+
+        rec["landmarks"] = face.shape
+        rec["l_hist"], rec["r_hist"] = face.eyes.hists()
+        rec["eye"] = face.eye_action.value
+        rec["head"] = face.head_action.value
+        rec["present"] = 1
+
+    def stop(self):
+        """Writes out the queued records and closes the file.
+
+        Returns at once if the writer already died, e.g. on a full disk,
+        instead of waiting for room in a queue nobody empties.
+        """
+        while self.is_alive():
+            try:
+                self.__queue.put(None, timeout=_STOP_POLL)
+                break
+            except queue.Full:
+                pass
+
+        self.join()
+
+
+def load_recording(path):
+    """Maps a session file written by SessionRecorder.
+
+    A record torn by a crash at the end of the file is left out.
+
+    Returns:
+        Read only structured memmap of RECORD_DTYPE records, so fields such as
+        records["landmarks"] are zero-copy views, and the frame width.
+    """
+    with open(path, "rb") as f:
+        magic, version, width, size = _HEADER.unpack(f.read(_HEADER.size))
+
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("Not a session recording: {}".format(path))
+    if size != RECORD_DTYPE.itemsize:
+        raise ValueError("Record size mismatch in {}".format(path))
+
+    count = (os.path.getsize(path) - _HEADER.size) // RECORD_DTYPE.itemsize
+    if count <= 0:
+        return np.zeros(0, dtype=RECORD_DTYPE), width
+
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode="r",
+                        offset=_HEADER.size, shape=(count,))
+
+    return records, width
@@ -0,0 +1,128 @@
+import sys
+import time
+import argparse
+
+from collections import namedtuple
+
+from capture import FrameProcessor
+from sources import open_source, LandmarkSource
+from tracking import TRACK_MODES, TRACK_CORRELATION
+from detectors import DETECT_SCALES, DETECTORS, DETECTOR_HOG
+
+ReplayEvent = namedtuple("ReplayEvent", ["index", "timestamp", "action"])
+
+ap = argparse.ArgumentParser(description="Replays recorded frames through "
+                                         "the detection pipeline.")
+ap.add_argument("-i", "--input", required=True,
+                help="Video file, image directory or .npz landmark "
+                     "recording.")
+ap.add_argument("-p", "--shape-predictor", required=False,
+                help="Path to facial landmark predictor. Not needed for "
+                     "landmark recordings.")
+ap.add_argument("-o", "--output", required=False,
+                help="Writes the action stream here instead of stdout.")
+ap.add_argument("--deterministic", action="store_true", required=False,
+                help="Timestamps actions with the source's frame times "
+                     "instead of the wall clock.")
+ap.add_argument("--redetect-interval", type=int, default=1, required=False,
+                help="Runs the face detector every N frames.")
+ap.add_argument("--track-mode", choices=TRACK_MODES,
+                default=TRACK_CORRELATION, required=False,
+                help="How faces are tracked between detections.")
+ap.add_argument("--detect-scale", type=float, choices=DETECT_SCALES,
+                default=1.0, required=False,
+                help="Downscale factor for face detection.")
+ap.add_argument("--detector", choices=DETECTORS, default=DETECTOR_HOG,
+                required=False,
+                help="Face detector backend. The cascades are cheaper than "
+                     "HOG; hybrid only runs HOG when the cascade misses.")
+ap.add_argument("--cascade", required=False,
+                help="Cascade file for the haar, lbp and hybrid detectors "
+                     "instead of the one installed with OpenCV.")
+ap.add_argument("--fast-eyes", type=float, required=False,
+                metavar="MAX_FALLBACK",
+                help="Decides eye states from the landmarks and only runs "
+                     "the pixel based eye pipeline on ambiguous faces, for "
+                     "at most this share of them, e.g. 0.2.")
+ap.add_argument("--smooth", action="store_true", required=False,
+                help="Smooths the landmarks over time to steady the "
+                     "head/eye classifications.")
+ap.add_argument("--predictor-interval", type=int, default=1, required=False,
+                help="Runs the landmark predictor at least every N frames "
+                     "and predicts the landmarks of a still face in between. "
+                     "Implies --smooth.")
+ap.add_argument("--count-frames", action="store_true", required=False,
+                help="Confirms gestures by frame count instead of by frame "
+                     "timestamps.")
+ap.add_argument("--calibration", required=False,
+                help="Calibration profile with the Head/Eyes thresholds, "
+                     "see calibrate.py. The defaults are used without one, "
+                     "so replays do not depend on the local profile.")
+
+
+def replay(source, processor, deterministic=False):
+    """Runs every frame of a finite source through the full pipeline.
+
+    Frames are processed back to back, not in real time.
+
+    Args:
+        source: sources.FrameSource.
+        processor: capture.FrameProcessor.
+        deterministic: Timestamp events with the source's frame times, so the
+                       same input always produces the same stream.
+    Yields:
+        ReplayEvent for every action the ActionHandler fires.
+    """
+    for frame in source:
+        _, faces = processor.process(frame)
+
+        for face in faces:
+            if face.action is None:
+                continue
+
+            timestamp = frame.timestamp if deterministic else time.monotonic()
+            yield ReplayEvent(frame.index, timestamp, face.action)
+
+
+def main():
+    args = vars(ap.parse_args())
+
+    source = open_source(args["input"])
+    if source.live:
+        ap.error("Replay needs a finite source, not a camera.")
+    if args["shape_predictor"] is None \
+            and not isinstance(source, LandmarkSource):
+        ap.error("--shape-predictor is required for video and image "
+                 "sources.")
+
+    processor = FrameProcessor(args["shape_predictor"],
+                               args["redetect_interval"], args["track_mode"],
+                               args["detect_scale"], args["count_frames"],
+                               args["calibration"],
+                               detector=args["detector"],
+                               cascade=args["cascade"],
+                               eye_fallback=args["fast_eyes"],
+                               smooth=args["smooth"],
+                               predictor_interval=args["predictor_interval"])
+
+    out = open(args["output"], "w") if args["output"] else sys.stdout
+
+    start = time.perf_counter()
+    actions = 0
+    for event in replay(source, processor, args["deterministic"]):
+        out.write("{} {:.3f} {}\n".format(event.index, event.timestamp,
+                                          event.action))
+        actions += 1
+    elapsed = time.perf_counter() - start
+
+    source.release()
+    if out is not sys.stdout:
+        out.close()
+
+    frames = source.frames_read
+    print("{} frames in {:.2f} s ({:.1f} fps), {} actions".format(
+        frames, elapsed, frames / elapsed if elapsed else 0, actions),
+        file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import time
+
+MODE_ACTIVE = "active"
+MODE_IDLE = "idle"
+
+IDLE_AFTER = 5.0        # Seconds without a face before going idle.
+IDLE_FPS = 2.0          # Polling rate while idle.
+_BACKOFF_MIN = 0.005    # First wait after a failed camera read.
+_BACKOFF_MAX = 1.0
+_FPS_SMOOTHING = 0.1    # Weight of the newest frame in the FPS average.
+
+
+class AdaptiveScheduler():
+    """Throttles the capture loop while nobody is in front of the camera.
+
+    In active mode frames are processed as fast as they come. Once no face
+    has been seen for idle_after seconds the scheduler goes idle: the loop is
+    paced to idle_fps and the processor is asked for cheap detection. The
+    first frame with a face switches straight back to active. Failed camera
+    reads back off exponentially instead of spinning.
+    """
+    def __init__(self, idle_after=IDLE_AFTER, idle_fps=IDLE_FPS,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.__idle_after = idle_after
+        self.__idle_period = 1 / idle_fps
+        self.__clock = clock
+        self.__sleep = sleep
+
+        self.mode = MODE_ACTIVE
+        self.fps = 0.0
+
+        self.__last_face = clock()
+        self.__last_frame = None
+        self.__backoff = 0.0
+
+    @property
+    def idle(self):
+        return self.mode == MODE_IDLE
+
+    @property
+    def period(self):
+        """Minimum seconds between frames, 0 while active."""
+        return self.__idle_period if self.idle else 0.0
+
+    def wait(self):
+        """Sleeps until the next frame is due."""
+        if not self.idle or self.__last_frame is None:
+            return
+
+        delay = self.__last_frame + self.__idle_period - self.__clock()
+        if delay > 0:
+            self.__sleep(delay)
+
+    def read_failed(self):
+        """Backs off after a camera read returned no frame."""
+        self.__backoff = min(_BACKOFF_MAX,
+                             max(_BACKOFF_MIN, 2 * self.__backoff))
+        self.__sleep(self.__backoff)
+
+    def frame_done(self, face_found):
+        """Records a processed frame and switches mode if needed."""
+        now = self.__clock()
+        self.__backoff = 0.0
+
+        if self.__last_frame is not None and now > self.__last_frame:
+            fps = 1 / (now - self.__last_frame)
+            self.fps += _FPS_SMOOTHING * (fps - self.fps)
+        self.__last_frame = now
+
+        if face_found:
+            self.__last_face = now
+            self.mode = MODE_ACTIVE
+        elif self.__idle_after and now - self.__last_face > self.__idle_after:
+            self.mode = MODE_IDLE
+
+    def stats(self):
+        return {"mode": self.mode, "fps": round(self.fps, 1)}
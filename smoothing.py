@@ -0,0 +1,106 @@
+import math
+
+import numpy as np
+
+_MIN_CUTOFF = 1.0       # Hz; smoothing of a still face.
+_BETA = 0.05            # How fast the cutoff rises with landmark speed.
+_D_CUTOFF = 1.0         # Hz; smoothing of the speed estimate.
+_MIN_DT = 1e-3
+_STILL_SPEED = 20.0     # px/s; faster faces are always measured.
+
+
+def _alpha(cutoff, dt):
+    tau = 1 / (2 * math.pi * cutoff)
+    return 1 / (1 + tau / dt)
+
+
+class OneEuroFilter():
+    """One euro filter over a whole landmark array at once.
+
+    Every coordinate gets its own adaptive low pass: slow landmarks are
+    smoothed hard to remove jitter, fast ones barely so they do not lag.
+    The speed estimate also extrapolates the landmarks with predict().
+    speed() is taken from the last two raw measurements, so it reacts to a
+    face starting to move on the very next one, and from the landmarks' mean
+    position, so the jitter of single landmarks averages out.
+
+    source: https://hal.inria.fr/hal-00670496/document
+    """
+    def __init__(self, min_cutoff=_MIN_CUTOFF, beta=_BETA,
+                 d_cutoff=_D_CUTOFF):
+        self.__min_cutoff = min_cutoff
+        self.__beta = beta
+        self.__d_cutoff = d_cutoff
+
+        self.__x = None
+        self.__dx = None
+        self.__t = None
+        self.__raw = None
+        self.__speed = math.inf
+
+    def __call__(self, x, t):
+        """
+        Args:
+            x: (68, 2) measured landmarks.
+            t: Their timestamp in seconds.
+        Returns:
+            (68, 2) float smoothed landmarks.
+        """
+        x = np.asarray(x, dtype=np.float64)
+
+        if self.__x is None:
+            self.__x, self.__dx, self.__t = x, np.zeros_like(x), t
+            self.__raw = x
+            return x
+
+        dt = max(t - self.__t, _MIN_DT)
+        shift = (x - self.__raw).mean(axis=0)
+        self.__speed = float(np.abs(shift).max()) / dt
+        self.__raw = x
+
+        a_d = _alpha(self.__d_cutoff, dt)
+        self.__dx = a_d * (x - self.__x) / dt + (1 - a_d) * self.__dx
+
+        cutoff = self.__min_cutoff + self.__beta * np.abs(self.__dx)
+        tau = 1 / (2 * np.pi * cutoff)
+        a = 1 / (1 + tau / dt)
+
+        self.__x = a * x + (1 - a) * self.__x
+        self.__t = t
+
+        return self.__x
+
+    def predict(self, t):
+        """Landmarks at t by constant velocity; the filter is not updated."""
+        return self.__x + self.__dx * (t - self.__t)
+
+    def speed(self):
+        """Speed of the landmarks' mean position in px/s between the last two
+        measurements; inf until there are two."""
+        return self.__speed
+
+
+class LandmarkSmoother():
+    """Smooths one face's landmarks and decides when to skip the predictor.
+
+    The shape predictor runs at least every interval frames. In between,
+    frames where the face moved slower than _STILL_SPEED between the last
+    two measurements get the filter's prediction instead of a measurement.
+    A new face is measured at least twice before any frame is predicted.
+    """
+    def __init__(self, interval=1):
+        self.__filter = OneEuroFilter()
+        self.__interval = max(1, interval)
+        self.__skipped = 0
+
+    def can_predict(self):
+        return self.__skipped < self.__interval - 1 and \
+            self.__filter.speed() < _STILL_SPEED
+
+    def predict(self, t):
+        self.__skipped += 1
+        return self.__filter.predict(t)
+
+    def measure(self, shape, t):
+        self.__skipped = 0
+        return self.__filter(shape, t)
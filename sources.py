@@ -0,0 +1,315 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+from collections import namedtuple
+
+from buffers import BufferPool
+from recorder import load_recording, SESSION_EXT
+
+_IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp")
+_DEFAULT_FPS = 30.0
+# Frames in flight at once: a full pipeline.FrameRing, the frame being read
+# and the frame just taken from the ring. The reader does not wait for the
+# processing stage, so ActionStream copies the frame it takes before working
+# on it.
+_CAPTURE_BUFFERS = 4
+_PROBE_FRAMES = 30
+
+Frame = namedtuple("Frame", [
+    "image",        # BGR frame, or None for recorded landmark streams.
+    "timestamp",    # Seconds; monotonic clock for live sources.
+    "index",        # Frame number within the source.
+    "landmarks",    # (68, 2) recorded landmarks, None if not recorded.
+    "width",        # Width of the processed frame for recorded landmarks.
+    "hists",        # Recorded (left, right) eye histograms, or None.
+    "cropped",      # True if the camera already cut out the middle half.
+])
+Frame.__new__.__defaults__ = (None, None, None, False)
+
+CameraConfig = namedtuple("CameraConfig", [
+    "width", "height", "fps",
+    "fourcc",       # Four character pixel format, e.g. "MJPG".
+    "buffersize",   # Frames the driver queues up.
+    "crop",         # Asks the sensor for only the middle half of the columns.
+])
+CameraConfig.__new__.__defaults__ = (None,) * 5 + (False,)
+
+
+class FrameSource():
+    """Where capture_action gets its frames from.
+
+    read() returns a Frame, or None when no frame is available right now.
+    Once a finite source runs out, exhausted is set. Sources that read into
+    preallocated frames keep them in pool.
+    """
+    live = False
+    pool = None
+
+    def __init__(self):
+        self.exhausted = False
+        self._index = 0
+
+    def _frame(self, image, timestamp, **kwargs):
+        frame = Frame(image, timestamp, self._index, **kwargs)
+        self._index += 1
+
+        return frame
+
+    @property
+    def frames_read(self):
+        return self._index
+
+    def read(self):
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+    def __iter__(self):
+        while not self.exhausted:
+            frame = self.read()
+            if frame is not None:
+                yield frame
+
+
+class WebcamSource(FrameSource):
+    """Camera frames, read into a rotation of _CAPTURE_BUFFERS frames.
+
+    A frame's image is overwritten _CAPTURE_BUFFERS reads later.
+
+    Args:
+        device: Camera index.
+        config: CameraConfig; settings left as None keep the driver default.
+                The driver picks the closest mode it supports, see mode().
+    """
+    live = True
+
+    def __init__(self, device=0, config=None):
+        super().__init__()
+        self.camera = cv2.VideoCapture(device)
+        self.pool = BufferPool()
+
+        self.cropped = False
+        if config is not None:
+            self.__configure(config)
+
+    def __configure(self, config):
+        camera = self.camera
+
+        # The pixel format goes first: it decides which sizes are available.
+        if config.fourcc:
+            camera.set(cv2.CAP_PROP_FOURCC,
+                       cv2.VideoWriter_fourcc(*config.fourcc))
+        if config.width:
+            camera.set(cv2.CAP_PROP_FRAME_WIDTH, config.width)
+        if config.height:
+            camera.set(cv2.CAP_PROP_FRAME_HEIGHT, config.height)
+        if config.fps:
+            camera.set(cv2.CAP_PROP_FPS, config.fps)
+        if config.buffersize:
+            camera.set(cv2.CAP_PROP_BUFFERSIZE, config.buffersize)
+
+        if config.crop:
+            self.cropped = self.__crop()
+
+    def __crop(self):
+        """Sensor ROI of the middle half of the columns.
+
+        Only backends with ROI properties (XIMEA) accept this; everywhere
+        else the preprocessor keeps cropping with a view.
+
+        Returns:
+            True if the camera now delivers the cropped frame.
+        """
+        w = int(self.camera.get(cv2.CAP_PROP_FRAME_WIDTH))
+        if not w:
+            return False
+
+        return (self.camera.set(cv2.CAP_PROP_XI_WIDTH, w // 2)
+                and self.camera.set(cv2.CAP_PROP_XI_OFFSET_X, w // 4)
+                and int(self.camera.get(cv2.CAP_PROP_FRAME_WIDTH)) == w // 2)
+
+    def mode(self):
+        """Capture mode the driver actually negotiated."""
+        fourcc = int(self.camera.get(cv2.CAP_PROP_FOURCC))
+
+        return {
+            "width": int(self.camera.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "fps": self.camera.get(cv2.CAP_PROP_FPS),
+            "fourcc": fourcc.to_bytes(4, "little").decode("ascii", "replace")
+                      .strip("\0"),
+            "buffersize": int(self.camera.get(cv2.CAP_PROP_BUFFERSIZE)),
+            "cropped": self.cropped,
+        }
+
+    def probe(self, frames=_PROBE_FRAMES):
+        """Measures the frame rate the camera delivers.
+
+        The frames read are dropped, so do this before capturing.
+
+        Returns:
+            Frames per second, 0 if the camera delivered nothing.
+        """
+        start, read = None, 0
+        for _ in range(frames):
+            if self.read() is None:
+                continue
+
+            # The first frame can take as long as the camera needs to start.
+            if start is None:
+                start = time.monotonic()
+            else:
+                read += 1
+
+        self._index = 0
+        elapsed = time.monotonic() - start if start is not None else 0
+
+        return read / elapsed if elapsed else 0.0
+
+    def read(self):
+        key = ("capture", self._index % _CAPTURE_BUFFERS)
+        buf = self.pool.peek(key)
+
+        # Allocates a new frame only if buf is missing or the wrong size.
+        _, image = self.camera.read(image=buf)
+        if image is None:
+            return None
+        if image is not buf:
+            self.pool.put(key, image)
+
+        return self._frame(image, time.monotonic(), cropped=self.cropped)
+
+    def release(self):
+        self.camera.release()
+
+
+class VideoFileSource(FrameSource):
+    """Frames of a video file, timestamped with their position in it."""
+    def __init__(self, path):
+        super().__init__()
+
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+
+        self.__video = cv2.VideoCapture(path)
+
+    def read(self):
+        ok, image = self.__video.read()
+        if not ok:
+            self.exhausted = True
+            return None
+
+        timestamp = self.__video.get(cv2.CAP_PROP_POS_MSEC) / 1000
+
+        return self._frame(image, timestamp)
+
+    def release(self):
+        self.__video.release()
+
+
+class ImageDirectorySource(FrameSource):
+    """Image sequence in name order, timestamped at a fixed frame rate."""
+    def __init__(self, path, fps=_DEFAULT_FPS):
+        super().__init__()
+
+        self.__paths = [os.path.join(path, n) for n in sorted(os.listdir(path))
+                        if n.lower().endswith(_IMAGE_EXTS)]
+        self.__fps = fps
+
+    def read(self):
+        if self._index >= len(self.__paths):
+            self.exhausted = True
+            return None
+
+        image = cv2.imread(self.__paths[self._index])
+        if image is None:
+            # Unreadable images still take up a slot in the sequence.
+            self._index += 1
+            return None
+
+        return self._frame(image, self._index / self.__fps)
+
+
+class LandmarkSource(FrameSource):
+    """Recorded landmark stream, replayed without any image work.
+
+    The recording is either a session file written by recorder.py or an
+    .npz file with:
+        timestamps: (F,) frame times in seconds.
+        landmarks: (F, 68, 2) landmarks of the tracked face.
+        width: Width of the processed frames.
+        present: Optional (F,) bool, False for frames without a face.
+        l_hist, r_hist: Optional (F,) eye histograms. Without them the eyes
+                        are always reported open.
+    """
+    def __init__(self, path):
+        super().__init__()
+
+        data = load_landmarks(path)
+        self.__timestamps = data["timestamps"]
+        self.__landmarks = data["landmarks"]
+        self.__width = int(data["width"])
+
+        n = len(self.__timestamps)
+        self.__present = data["present"] if "present" in data \
+            else np.ones(n, dtype=bool)
+        self.__hists = np.stack([data["l_hist"], data["r_hist"]], axis=1) \
+            if "l_hist" in data else None
+
+    def read(self):
+        i = self._index
+        if i >= len(self.__timestamps):
+            self.exhausted = True
+            return None
+
+        landmarks, hists = None, None
+        if self.__present[i]:
+            landmarks = self.__landmarks[i]
+            hists = self.__hists[i] if self.__hists is not None else (1, 1)
+
+        return self._frame(None, float(self.__timestamps[i]),
+                           landmarks=landmarks, width=self.__width,
+                           hists=hists)
+
+
+def load_landmarks(path):
+    """Landmark recording fields by name, from an .npz or session file."""
+    if path.endswith(".npz"):
+        return np.load(path)
+
+    records, width = load_recording(path)
+
+    return {
+        "timestamps": records["timestamp"],
+        "landmarks": records["landmarks"],
+        "width": width,
+        "present": records["present"].astype(bool),
+        "l_hist": records["l_hist"],
+        "r_hist": records["r_hist"],
+    }
+
+
+def open_source(spec, camera=None):
+    """Picks a frame source from a command line value.
+
+    Args:
+        spec: Camera index, video file, image directory, .npz landmark
+              recording or session recording.
+        camera: CameraConfig, only used for cameras.
+    Returns:
+        FrameSource.
+    """
+    if isinstance(spec, int) or str(spec).isdigit():
+        return WebcamSource(int(spec), camera)
+
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec)
+
+    if spec.endswith((".npz", SESSION_EXT)):
+        return LandmarkSource(spec)
+
+    return VideoFileSource(spec)
@@ -3,7 +3,8 @@ import argparse
 
 from random import shuffle
 from action import HeadAction, success
-from capture import capture_action
+from capture import ActionStream
+from calibrate import PROFILE_PATH
 
 COMMANDS_LOG = "test_commands.txt"
 
@@ -38,10 +39,11 @@ def main():
 
     time.sleep(5)
 
-    def test(action):
-        print("============\n{}".format(action))
-
-    capture_action(args["shape_predictor"], test)
+    with ActionStream(args["shape_predictor"],
+                      profile=PROFILE_PATH) as stream:
+        for event in stream:
+            if event.action is not None:
+                print("============\n{}".format(event.action))
 
 if __name__ == "__main__":
     main()
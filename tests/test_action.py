@@ -0,0 +1,171 @@
+import numpy as np
+import pytest
+
+from action import GestureMachine, ActionHandler, HeadAction, EyeAction, \
+    HEAD_REST_STATE, EYE_REST_STATE, ACTIONS, NO_ACTION, encode, success, \
+    _HEAD_FRAMES, _EYE_FRAMES
+
+
+class _ReferenceHandler():
+    """The frame counting ActionHandler as it was before GestureMachine."""
+    def __init__(self):
+        self.prev_head = HEAD_REST_STATE
+        self.prev_eye = EYE_REST_STATE
+        self.eye_count = 0
+        self.head_count = 0
+        self.zoomed = False
+
+    def consec(self, prev, action, count):
+        if prev != action:
+            frames = _HEAD_FRAMES if type(action) == HeadAction \
+                else _EYE_FRAMES
+            if count >= frames:
+                return True, 0
+
+        return False, count + 1
+
+    def next_state(self, prev, now):
+        if prev not in success:
+            return False, None
+
+        req, action = success[prev]
+        if now not in req:
+            return False, None
+
+        if action == HeadAction.UNZOOM:
+            if not self.zoomed:
+                return False, None
+            self.zoomed = False
+
+        if action == HeadAction.ZOOM:
+            if self.zoomed:
+                return False, None
+            self.zoomed = True
+
+        return True, action
+
+    def get_next(self, e_action, h_action):
+        e_prev, h_prev = self.prev_eye, self.prev_head
+
+        if h_prev == HEAD_REST_STATE:
+            e_consec, e_count = self.consec(e_prev, e_action, self.eye_count)
+        else:
+            e_consec, e_count = False, 0
+
+        h_consec, h_count = self.consec(h_prev, h_action, self.head_count)
+
+        self.prev_eye, self.prev_head = e_action, h_action
+        self.eye_count, self.head_count = e_count, h_count
+
+        if h_consec:
+            self.eye_count = 0
+            return self.next_state(h_prev, h_action)
+        elif e_consec:
+            self.head_count = 0
+            return self.next_state(e_prev, e_action)
+
+        return False, None
+
+
+def _stream(n, seed):
+    """Random classification codes held for 1-6 frames at a time, with
+    timestamps at a jittery frame rate around 30 fps."""
+    rng = np.random.default_rng(seed)
+
+    def runs(values):
+        codes = []
+        while len(codes) < n:
+            codes += [rng.choice(values)] * int(rng.integers(1, 7))
+        return np.asarray(codes[:n], dtype=np.int64)
+
+    # Weighted towards the rest states so eye gestures get a chance.
+    eyes = [a.value for a in EyeAction] + [EYE_REST_STATE.value] * 4
+    heads = [a.value for a in HeadAction] + [HEAD_REST_STATE.value] * 6
+    timestamps = np.cumsum(rng.uniform(0.02, 0.05, n))
+
+    return runs(eyes), runs(heads), timestamps
+
+
+def _steps(machine, e_codes, h_codes, timestamps=None):
+    fired = []
+    for i, (e, h) in enumerate(zip(e_codes, h_codes)):
+        t = None if timestamps is None else float(timestamps[i])
+        code = machine.step(int(e), int(h), t)
+        if code != NO_ACTION:
+            fired.append((i, code))
+
+    return fired
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_step_matches_reference(seed):
+    e_codes, h_codes, _ = _stream(2000, seed)
+    reference, handler = _ReferenceHandler(), ActionHandler()
+
+    for e, h in zip(e_codes, h_codes):
+        e, h = EyeAction(int(e)), HeadAction(int(h))
+        assert handler.get_next(e, h) == reference.get_next(e, h)
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("timed", [False, True])
+def test_batch_matches_step(seed, timed):
+    e_codes, h_codes, timestamps = _stream(2000, seed)
+    timestamps = timestamps if timed else None
+
+    expected = _steps(GestureMachine(), e_codes, h_codes, timestamps)
+    at, codes = GestureMachine().batch(e_codes, h_codes, timestamps)
+
+    assert expected
+    assert list(zip(at.tolist(), codes.tolist())) == expected
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("timed", [False, True])
+def test_batch_continues_step_state(seed, timed):
+    e_codes, h_codes, timestamps = _stream(1500, seed)
+    timestamps = timestamps if timed else None
+    expected = _steps(GestureMachine(), e_codes, h_codes, timestamps)
+
+    # Alternate between step() and batch() over uneven slices.
+    machine, fired, start = GestureMachine(), [], 0
+    rng = np.random.default_rng(seed)
+    while start < len(e_codes):
+        end = min(len(e_codes), start + int(rng.integers(1, 200)))
+        t = None if timestamps is None else timestamps[start:end]
+
+        if rng.random() < 0.5:
+            at, codes = machine.batch(e_codes[start:end], h_codes[start:end],
+                                      t)
+            fired += [(start + i, c) for i, c in zip(at.tolist(),
+                                                      codes.tolist())]
+        else:
+            fired += [(start + i, c) for i, c in _steps(
+                machine, e_codes[start:end], h_codes[start:end], t)]
+        start = end
+
+    assert fired == expected
+
+
+def test_batch_empty():
+    at, codes = GestureMachine().batch([], [])
+
+    assert len(at) == 0 and len(codes) == 0
+
+
+def test_wink_fires_after_held_frames():
+    handler = ActionHandler()
+    closed, opened = EyeAction.LEFT_CLOSED, EyeAction.BOTH_OPEN
+    center = HeadAction.CENTER
+
+    results = [handler.get_next(closed, center)
+               for _ in range(_EYE_FRAMES + 1)]
+    results.append(handler.get_next(opened, center))
+
+    assert results[-1] == (True, EyeAction.LEFT_WINK)
+    assert not any(fired for fired, _ in results[:-1])
+
+
+def test_codes_round_trip():
+    for action in list(HeadAction) + list(EyeAction):
+        assert ACTIONS[encode(action)] == action
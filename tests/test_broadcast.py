@@ -0,0 +1,38 @@
+import errno
+import os
+import socket
+
+import pytest
+
+from broadcast import ActionBroadcaster
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "kender.sock")
+
+
+def test_refuses_socket_served_by_live_daemon(path):
+    first = ActionBroadcaster(path)
+    first.start()
+
+    try:
+        with pytest.raises(OSError) as e:
+            ActionBroadcaster(path)
+        assert e.value.errno == errno.EADDRINUSE
+        assert os.path.exists(path)
+    finally:
+        first.stop()
+
+    assert not os.path.exists(path)
+
+
+def test_replaces_stale_socket(path):
+    # Bound but closed without unlinking, as left by a crashed daemon.
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    broadcaster = ActionBroadcaster(path)
+    broadcaster.start()
+    broadcaster.stop()
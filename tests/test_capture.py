@@ -0,0 +1,76 @@
+import os
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("dlib")
+
+from buffers import BufferPool
+from capture import ActionStream
+from profiling import SlowFrameDumper
+from sources import FrameSource
+from utils import resize_frame
+
+_SHAPE = 48, 64, 3
+_ROTATION = 4
+
+
+def _image(index):
+    # Dark noise, so no face is ever found in it.
+    return np.random.default_rng(index).integers(
+        0, 16, _SHAPE, dtype=np.uint8)
+
+
+class _PooledSource(FrameSource):
+    """Live source that reads into a rotation of pooled buffers, like
+    sources.WebcamSource."""
+    live = True
+
+    def __init__(self):
+        super().__init__()
+        self.pool = BufferPool()
+
+    def read(self):
+        time.sleep(0.002)
+        buf = self.pool.get(("capture", self._index % _ROTATION), _SHAPE)
+        np.copyto(buf, _image(self._index))
+
+        return self._frame(buf, time.monotonic())
+
+    def release(self):
+        pass
+
+
+def test_pipelined_frame_survives_processing():
+    with ActionStream(source=_PooledSource(), pipelined=True,
+                      idle_after=0) as stream:
+        for n, (frame, image, _, _) in enumerate(stream.frames()):
+            original = _image(frame.index)
+
+            assert np.array_equal(frame.image, original)
+            assert np.array_equal(image, resize_frame(original))
+
+            if n == 10:
+                break
+
+
+def test_pipelined_dumps_hold_the_captured_frame(tmp_path):
+    dumper = SlowFrameDumper(str(tmp_path), 0)
+    indices = []
+
+    with ActionStream(source=_PooledSource(), pipelined=True,
+                      idle_after=0) as stream:
+        for n, (frame, _, faces, latency) in enumerate(stream.frames()):
+            dumper.check(frame, faces, latency, stream.metrics.frame)
+            indices.append(frame.index)
+
+            if n == 10:
+                break
+    dumper.close()
+
+    for index in indices:
+        dumped = cv2.imread(
+            os.path.join(str(tmp_path), "slow_{:06d}.png".format(index)))
+        assert np.array_equal(dumped, _image(index))
@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip("pyautogui")
+
+from macro import Macro, MacroExecutor
+
+
+class _Handler():
+    """Records injected macros and fails on the ones in failing."""
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.injected = []
+
+    def inject(self, macro):
+        if macro in self.failing:
+            raise KeyError(macro)
+        self.injected.append(macro)
+
+
+def test_executor_survives_failing_macro():
+    handler = _Handler(failing=(Macro.FULLSCREEN,))
+    executor = MacroExecutor(handler, min_interval=0)
+    executor.start()
+
+    for macro in (Macro.FULLSCREEN, Macro.COPY, Macro.PASTE):
+        executor.submit(macro)
+    executor.stop()
+
+    assert handler.injected == [Macro.COPY, Macro.PASTE]
+    stats = executor.stats()
+    assert stats["failed"] == 1
+    assert stats["executed"] == 2
+    assert stats["pending"] == 0
+
+
+def test_executor_coalesces_tab_bursts():
+    handler = _Handler()
+    executor = MacroExecutor(handler, min_interval=0)
+
+    for _ in range(3):
+        executor.submit(Macro.TAB_FORWARD)
+    executor.start()
+    executor.stop()
+
+    assert handler.injected == [Macro.TAB_FORWARD]
+    assert executor.stats()["coalesced"] == 2
@@ -0,0 +1,26 @@
+from metrics import MetricsRegistry
+
+
+def test_lap_adds_to_frame_in_flight():
+    metrics = MetricsRegistry()
+    metrics.begin_frame()
+
+    metrics.lap("detect", metrics.clock())
+    metrics.observe("detect", 0.5)
+
+    assert metrics.frame["detect"] >= 0.5
+    assert metrics.snapshot()["histograms"]["detect"]["count"] == 2
+
+    metrics.begin_frame()
+    assert not metrics.frame
+
+
+def test_observe_off_frame_only_updates_histogram():
+    metrics = MetricsRegistry()
+    metrics.begin_frame()
+
+    metrics.observe("macro", 0.01, frame=False)
+
+    assert "macro" not in metrics.frame
+    assert metrics.snapshot()["histograms"]["macro"]["count"] == 1
+    assert metrics.means()["macro"] == 10.0
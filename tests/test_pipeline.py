@@ -0,0 +1,89 @@
+import threading
+import time
+
+from pipeline import FrameRing, CameraReader
+from scheduler import AdaptiveScheduler
+from sources import FrameSource
+
+
+def test_pop_latest_takes_newest_and_drops_rest():
+    ring = FrameRing(size=2)
+    for i in range(5):
+        ring.push(i, float(i))
+
+    assert ring.pop_latest(timeout=0) == (4, 4.0)
+    assert ring.depth() == 0
+    assert ring.pushed == 5
+    # 3 overwritten while full, 1 stale frame dropped by the pop.
+    assert ring.dropped == 4
+
+
+def test_pop_latest_times_out_when_empty():
+    ring = FrameRing()
+
+    start = time.monotonic()
+    assert ring.pop_latest(timeout=0.05) == (None, None)
+    assert time.monotonic() - start >= 0.04
+
+
+def test_pop_latest_wakes_on_push():
+    ring = FrameRing()
+    threading.Timer(0.05, ring.push, ("frame", 1.0)).start()
+
+    assert ring.pop_latest(timeout=5) == ("frame", 1.0)
+
+
+def test_close_wakes_waiting_pop():
+    ring = FrameRing()
+    threading.Timer(0.05, ring.close).start()
+
+    start = time.monotonic()
+    assert ring.pop_latest(timeout=5) == (None, None)
+    assert time.monotonic() - start < 1
+
+
+def test_pop_latest_drains_after_close():
+    ring = FrameRing()
+    ring.push("last", 2.0)
+    ring.close()
+
+    assert ring.pop_latest(timeout=0) == ("last", 2.0)
+    assert ring.pop_latest(timeout=0) == (None, None)
+
+
+class _CountingSource(FrameSource):
+    live = True
+
+    def read(self):
+        return self._frame("frame", time.monotonic())
+
+    def release(self):
+        pass
+
+
+def _frames_read(scheduler, seconds=0.2):
+    source = _CountingSource()
+    reader = CameraReader(source, FrameRing(), scheduler)
+    reader.start()
+    time.sleep(seconds)
+    reader.stop()
+    reader.join()
+
+    return source.frames_read
+
+
+def test_reader_is_paced_while_idle():
+    scheduler = AdaptiveScheduler(idle_after=0.001, idle_fps=20)
+    time.sleep(0.01)
+    scheduler.frame_done(False)
+    assert scheduler.idle
+
+    # 20 fps for 0.2 seconds, and the first read is not delayed.
+    assert _frames_read(scheduler) <= 6
+
+
+def test_reader_runs_free_while_active():
+    scheduler = AdaptiveScheduler(idle_after=0.001, idle_fps=20)
+    assert not scheduler.idle
+
+    assert _frames_read(scheduler) > 50
@@ -0,0 +1,33 @@
+import os
+
+import cv2
+import numpy as np
+
+from profiling import SlowFrameDumper
+from sources import Frame
+
+
+def _image(seed):
+    return np.random.default_rng(seed).integers(
+        0, 256, (48, 64, 3), dtype=np.uint8)
+
+
+def _dumped(directory, index):
+    return cv2.imread(os.path.join(directory, "slow_{:06d}.png".format(index)))
+
+
+def test_dump_holds_the_checked_frame(tmp_path):
+    dumper = SlowFrameDumper(str(tmp_path), 0.01)
+    buf = np.empty((48, 64, 3), np.uint8)
+
+    for index in range(3):
+        # Every frame is read into the same buffer, like a pooled camera.
+        np.copyto(buf, _image(index))
+        dumper.check(Frame(buf, 0.0, index), [], 0.05, {"capture": 0.05})
+    dumper.check(Frame(buf, 0.0, 3), [], 0.005, {})
+    dumper.close()
+
+    assert dumper.dumps == 3
+    for index in range(3):
+        assert np.array_equal(_dumped(str(tmp_path), index), _image(index))
+    assert not os.path.exists(os.path.join(str(tmp_path), "slow_000003.png"))
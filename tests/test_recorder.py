@@ -0,0 +1,137 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from action import HeadAction, EyeAction
+from recorder import SessionRecorder, load_recording, RECORD_DTYPE, \
+    SESSION_EXT
+from sources import LandmarkSource
+
+_WIDTH = 320
+
+
+class _Rect():
+    def __init__(self, left, top, right, bottom):
+        self.__box = left, top, right, bottom
+
+    def left(self):
+        return self.__box[0]
+
+    def top(self):
+        return self.__box[1]
+
+    def right(self):
+        return self.__box[2]
+
+    def bottom(self):
+        return self.__box[3]
+
+
+def _face(rng, hists=(0.5, 0.25)):
+    """Just the capture.FaceResult fields SessionRecorder reads."""
+    return SimpleNamespace(
+        rect=_Rect(10, 20, 110, 140),
+        shape=rng.integers(0, 300, (68, 2)),
+        eyes=SimpleNamespace(hists=lambda: hists),
+        eye_action=EyeAction.LEFT_CLOSED,
+        head_action=HeadAction.UP)
+
+
+@pytest.fixture
+def session(tmp_path):
+    return str(tmp_path / ("session" + SESSION_EXT))
+
+
+def _record(path, faces, **kwargs):
+    recorder = SessionRecorder(path, **kwargs)
+    recorder.start()
+    for i, face in enumerate(faces):
+        recorder.record(i / 30, _WIDTH, face)
+    recorder.stop()
+
+    return recorder
+
+
+def test_round_trip_through_landmark_source(session):
+    rng = np.random.default_rng(0)
+    faces = [_face(rng) if i % 3 else None for i in range(600)]
+    faces[4] = _face(rng, (float("nan"), float("nan")))
+
+    recorder = _record(session, faces, chunk=64)
+    assert recorder.records == len(faces)
+    assert recorder.dropped == 0
+
+    records, width = load_recording(session)
+    assert width == _WIDTH
+    assert records["rect"][1].tolist() == [10, 20, 110, 140]
+
+    frames = list(LandmarkSource(session))
+    assert len(frames) == len(faces)
+
+    for i, (frame, face) in enumerate(zip(frames, faces)):
+        assert frame.index == i
+        assert frame.timestamp == pytest.approx(i / 30)
+        assert frame.width == _WIDTH
+
+        if face is None:
+            assert frame.landmarks is None
+            continue
+
+        assert np.array_equal(frame.landmarks, face.shape)
+        assert np.allclose(frame.hists, face.eyes.hists(), equal_nan=True)
+
+
+def test_empty_session(session):
+    _record(session, [])
+
+    records, _ = load_recording(session)
+    assert len(records) == 0
+
+
+def test_crashed_session_keeps_width_and_whole_records(session):
+    rng = np.random.default_rng(1)
+    _record(session, [_face(rng) for _ in range(10)])
+
+    # A crash in the middle of the next record.
+    with open(session, "ab") as f:
+        f.write(b"\0" * (RECORD_DTYPE.itemsize // 2))
+
+    records, width = load_recording(session)
+    assert len(records) == 10
+    assert width == _WIDTH
+
+
+def test_full_queue_drops_records(session):
+    recorder = SessionRecorder(session, size=4)
+    for i in range(10):
+        recorder.record(i, _WIDTH)
+    assert recorder.dropped == 6
+
+    recorder.start()
+    recorder.stop()
+    assert len(load_recording(session)[0]) == 4
+
+
+def test_unwritable_path_raises_on_start(tmp_path):
+    recorder = SessionRecorder(str(tmp_path / "missing" / "session"))
+
+    with pytest.raises(OSError):
+        recorder.start()
+
+
+@pytest.mark.filterwarnings(
+    "ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_stop_returns_after_writer_died(session):
+    recorder = SessionRecorder(session, size=2)
+    recorder.start()
+    # A face without the recorded fields kills the writer.
+    recorder.record(0.0, _WIDTH, object())
+    recorder.join(timeout=5)
+    assert not recorder.is_alive()
+
+    for i in range(3):
+        recorder.record(i, _WIDTH)
+    assert recorder.dropped == 1
+
+    recorder.stop()
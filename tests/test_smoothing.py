@@ -0,0 +1,71 @@
+import numpy as np
+
+from smoothing import OneEuroFilter, LandmarkSmoother
+
+_FPS = 30.0
+
+
+def _run(xs, interval=5, jitter=0.0, seed=0):
+    """Feeds faces at x positions xs to a LandmarkSmoother.
+
+    Returns:
+        "m" or "p" for every frame, measured or predicted.
+    """
+    rng = np.random.default_rng(seed)
+    template = rng.uniform(200, 400, (68, 2))
+    smoother = LandmarkSmoother(interval)
+
+    steps = []
+    for i, x in enumerate(xs):
+        t = i / _FPS
+        shape = template + [x, 0] + rng.normal(0, jitter, template.shape)
+        if smoother.can_predict():
+            smoother.predict(t)
+            steps.append("p")
+        else:
+            smoother.measure(shape, t)
+            steps.append("m")
+
+    return steps
+
+
+def test_speed_unknown_until_two_measurements():
+    f = OneEuroFilter()
+    assert f.speed() == float("inf")
+
+    f(np.zeros((68, 2)), 0.0)
+    assert f.speed() == float("inf")
+
+    f(np.full((68, 2), 3.0), 0.1)
+    assert np.isclose(f.speed(), 30.0)
+
+
+def test_new_face_is_measured_twice():
+    assert _run([0.0] * 4)[:2] == ["m", "m"]
+
+
+def test_moving_face_always_measured():
+    # 300 px/s from the first frame on.
+    assert _run([300 * i / _FPS for i in range(30)]) == ["m"] * 30
+
+
+def test_face_starting_to_move_is_measured_next():
+    steps = _run([0.0] * 10 + [100 * i / _FPS for i in range(1, 21)])
+
+    assert "p" in steps[:10]
+    # Frames up to the next measurement may still be predicted; the first
+    # measurement that sees the move ends the skipping.
+    first = steps.index("m", 10)
+    assert steps[first:] == ["m"] * (len(steps) - first)
+
+
+def test_still_face_skips_up_to_interval():
+    steps = _run([0.0] * 32, interval=4, jitter=0.5)
+
+    assert steps[:2] == ["m", "m"]
+    assert "mppp" in "".join(steps[2:])
+    assert "pppp" not in "".join(steps)
+
+
+def test_interval_one_never_predicts():
+    assert _run([0.0] * 10, interval=1) == ["m"] * 10
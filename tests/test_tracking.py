@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+dlib = pytest.importorskip("dlib")
+
+from tracking import FaceSelector, FaceTracker, SELECT_ALL, SELECT_STICKY, \
+    TRACK_LANDMARKS
+
+_SIZE = 640, 480
+
+
+def _rect(x, y, size=100):
+    return dlib.rectangle(x, y, x + size, y + size)
+
+
+def test_all_keeps_ids_of_moving_faces():
+    selector = FaceSelector(SELECT_ALL)
+
+    first = dict(selector.select([_rect(0, 0), _rect(300, 0)], *_SIZE))
+    # Same faces, slightly moved and listed in the other order.
+    second = dict(selector.select([_rect(305, 5), _rect(5, 5)], *_SIZE))
+
+    assert first == {0: 0, 1: 1}
+    assert second == {1: 0, 0: 1}
+
+
+def test_all_gives_new_faces_new_ids():
+    selector = FaceSelector(SELECT_ALL)
+
+    selector.select([_rect(0, 0)], *_SIZE)
+    picked = dict(selector.select([_rect(0, 0), _rect(300, 300)], *_SIZE))
+
+    assert picked == {0: 0, 1: 1}
+
+
+def test_all_never_reuses_ids():
+    selector = FaceSelector(SELECT_ALL, grace=0)
+
+    selector.select([_rect(0, 0)], *_SIZE)
+    selector.select([], *_SIZE)
+    picked = selector.select([_rect(0, 0)], *_SIZE)
+
+    assert picked == [(0, 1)]
+
+
+def test_missed_face_keeps_id_for_grace_frames():
+    selector = FaceSelector(SELECT_ALL, grace=2)
+
+    selector.select([_rect(0, 0), _rect(300, 0)], *_SIZE)
+    # The first face is missed for two frames.
+    for _ in range(2):
+        assert selector.select([_rect(300, 0)], *_SIZE) == [(0, 1)]
+        assert selector.face_ids() == {0, 1}
+
+    picked = selector.select([_rect(300, 0), _rect(5, 0)], *_SIZE)
+    assert dict(picked) == {0: 1, 1: 0}
+
+
+def test_face_forgotten_after_grace():
+    selector = FaceSelector(SELECT_ALL, grace=2)
+
+    selector.select([_rect(0, 0)], *_SIZE)
+    for _ in range(3):
+        selector.select([], *_SIZE)
+    assert selector.face_ids() == set()
+
+    assert selector.select([_rect(0, 0)], *_SIZE) == [(0, 1)]
+
+
+def test_sticky_keeps_id_through_a_miss():
+    selector = FaceSelector(SELECT_STICKY)
+
+    selector.select([_rect(0, 0)], *_SIZE)
+    selector.select([], *_SIZE)
+
+    assert selector.select([_rect(300, 300, 150), _rect(5, 5)],
+                           *_SIZE) == [(1, 0)]
+
+
+def test_sticky_follows_face_over_larger_one():
+    selector = FaceSelector(SELECT_STICKY)
+
+    assert selector.select([_rect(0, 0)], *_SIZE) == [(0, 0)]
+    i, face_id = selector.select([_rect(300, 300, 150), _rect(10, 10)],
+                                 *_SIZE)[0]
+
+    assert (i, face_id) == (1, 0)
+
+
+class _CountingDetector():
+    def __init__(self, rects):
+        self.rects = rects
+        self.calls = 0
+
+    def __call__(self, gray, upsample=0):
+        self.calls += 1
+        return list(self.rects)
+
+
+def _shape(rect):
+    """Landmarks whose padded box is rect again."""
+    inset = rect.width() // 12
+    xs = np.linspace(rect.left() + inset, rect.right() - inset, 68)
+    ys = np.linspace(rect.top() + inset, rect.bottom() - inset, 68)
+
+    return np.stack([xs, ys], axis=1).astype(int)
+
+
+def test_landmark_track_kept_while_landmarks_fit():
+    detector = _CountingDetector([_rect(100, 100)])
+    tracker = FaceTracker(detector, interval=10, mode=TRACK_LANDMARKS)
+
+    for _ in range(5):
+        rects = tracker.rects(None)
+        tracker.follow([_shape(rects[0])])
+
+    assert detector.calls == 1
+
+
+def test_landmark_track_lost_when_landmarks_drift():
+    detector = _CountingDetector([_rect(100, 100)])
+    tracker = FaceTracker(detector, interval=10, mode=TRACK_LANDMARKS)
+
+    tracker.rects(None)
+    # The predictor latched onto something far off the tracked face.
+    tracker.follow([_shape(_rect(180, 180))])
+    tracker.rects(None)
+
+    assert detector.calls == 2
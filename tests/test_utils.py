@@ -0,0 +1,30 @@
+import numpy as np
+
+from buffers import BufferPool
+from utils import FramePreprocessor, resize_frame
+
+
+def _frame(seed, shape=(48, 64, 3)):
+    return np.random.default_rng(seed).integers(
+        0, 256, shape, dtype=np.uint8)
+
+
+def test_preprocessor_matches_resize_frame():
+    preprocess = FramePreprocessor()
+
+    for seed in range(3):
+        frame = _frame(seed)
+        image, gray = preprocess(frame)
+
+        assert np.array_equal(image, resize_frame(frame))
+        assert gray.shape == image.shape[:2]
+
+
+def test_preprocessor_leaves_frame_alone():
+    pool = BufferPool()
+    frame = _frame(0)
+    original = frame.copy()
+
+    FramePreprocessor(pool)(frame)
+
+    assert np.array_equal(frame, original)
@@ -0,0 +1,263 @@
+import dlib
+
+_REDETECT_INTERVAL = 1
+_MIN_CONFIDENCE = 7.0     # Peak-to-sidelobe ratio below which a track is lost.
+_MIN_TRACK_IOU = 0.5      # Landmark box overlap below which a track is lost.
+_LANDMARK_PADDING = 0.1   # Fraction of the landmark box added on each side.
+
+TRACK_CORRELATION = "correlation"
+TRACK_LANDMARKS = "landmarks"
+TRACK_MODES = (TRACK_CORRELATION, TRACK_LANDMARKS)
+
+_MIN_IOU = 0.3            # Overlap needed to keep a face's identity.
+_MISS_GRACE = 10          # Frames a missed face keeps its identity.
+
+SELECT_STICKY = "sticky"
+SELECT_LARGEST = "largest"
+SELECT_CENTRAL = "central"
+SELECT_ALL = "all"
+SELECT_POLICIES = (SELECT_STICKY, SELECT_LARGEST, SELECT_CENTRAL, SELECT_ALL)
+
+
+def landmark_rect(shape, padding=_LANDMARK_PADDING):
+    """Face rectangle around a set of landmarks.
+
+    Args:
+        shape: (68, 2) landmark array.
+        padding: Fraction of the box size to add on each side.
+    Returns:
+        dlib.rectangle enclosing the landmarks.
+    """
+    (l, t), (r, b) = shape.min(axis=0), shape.max(axis=0)
+    pad_x, pad_y = int((r - l) * padding), int((b - t) * padding)
+
+    return dlib.rectangle(int(l - pad_x), int(t - pad_y),
+                          int(r + pad_x), int(b + pad_y))
+
+
+def iou(a, b):
+    """Intersection over union of two dlib.rectangles."""
+    w = min(a.right(), b.right()) - max(a.left(), b.left())
+    h = min(a.bottom(), b.bottom()) - max(a.top(), b.top())
+    if w <= 0 or h <= 0:
+        return 0.0
+
+    inter = w * h
+    return inter / (a.area() + b.area() - inter)
+
+
+class FaceSelector():
+    """Decides which detected faces get the expensive per-face work.
+
+    sticky keeps following the face picked last frame as long as one overlaps
+    it by min_iou, and otherwise falls back to the largest face. largest and
+    central pick the biggest or most centered face every frame. all keeps
+    every face, each with an identity carried over by overlap.
+
+    A face that is not detected keeps its identity, at its last rect, for up
+    to grace frames, so a single detector miss does not turn it into a new
+    face.
+    """
+    def __init__(self, policy=SELECT_STICKY, min_iou=_MIN_IOU,
+                 grace=_MISS_GRACE):
+        if policy not in SELECT_POLICIES:
+            raise ValueError("Unknown face policy: {}".format(policy))
+
+        self.__policy = policy
+        self.__min_iou = min_iou
+        self.__grace = grace
+        # (face id, rect) picked last frame, then the ones in their grace
+        # period with the frames they have been missed for.
+        self.__prev = []
+        self.__missed = {}
+        self.__next_id = 0
+
+    def __new_id(self):
+        self.__next_id += 1
+        return self.__next_id - 1
+
+    def __match(self, rect, taken):
+        """Id of the best overlapping previous face not yet taken."""
+        best, best_iou = None, self.__min_iou
+        for face_id, prev in self.__prev:
+            overlap = iou(rect, prev)
+            if face_id not in taken and overlap >= best_iou:
+                best, best_iou = face_id, overlap
+
+        return best
+
+    def select(self, rects, width, height):
+        """
+        Args:
+            rects: Face rectangles of the current frame.
+            width, height: Frame size.
+        Returns:
+            Indices into rects and face ids of the selected faces.
+        """
+        if not rects:
+            self.__remember([])
+            return []
+
+        if self.__policy == SELECT_ALL:
+            picked, taken = [], set()
+            for i, rect in enumerate(rects):
+                face_id = self.__match(rect, taken)
+                if face_id is None:
+                    face_id = self.__new_id()
+                taken.add(face_id)
+                picked.append((i, face_id))
+        else:
+            picked = [self.__primary(rects, width, height)]
+
+        self.__remember([(face_id, rects[i]) for i, face_id in picked])
+
+        return picked
+
+    def __remember(self, picked):
+        ids = set(face_id for face_id, _ in picked)
+        missed = {}
+        for face_id, rect in self.__prev:
+            if face_id in ids:
+                continue
+
+            missed[face_id] = self.__missed.get(face_id, 0) + 1
+            if missed[face_id] <= self.__grace:
+                picked.append((face_id, rect))
+            else:
+                del missed[face_id]
+
+        self.__prev = picked
+        self.__missed = missed
+
+    def face_ids(self):
+        """Ids of the faces picked last frame or still in their grace
+        period; per-face state of any other id can be dropped."""
+        return set(face_id for face_id, _ in self.__prev)
+
+    def __primary(self, rects, width, height):
+        largest = max(range(len(rects)), key=lambda i: rects[i].area())
+
+        if self.__policy == SELECT_CENTRAL:
+            cx, cy = width / 2, height / 2
+            central = min(range(len(rects)), key=lambda i: (
+                (rects[i].center().x - cx) ** 2 +
+                (rects[i].center().y - cy) ** 2))
+            return central, self.__keep_id(rects[central])
+
+        if self.__policy == SELECT_STICKY and self.__prev:
+            face_id, prev = self.__prev[0]
+            best = max(range(len(rects)), key=lambda i: iou(rects[i], prev))
+            if iou(rects[best], prev) >= self.__min_iou:
+                return best, face_id
+
+        return largest, self.__keep_id(rects[largest])
+
+    def __keep_id(self, rect):
+        face_id = self.__match(rect, ())
+        return self.__new_id() if face_id is None else face_id
+
+
+class FaceTracker():
+    """Detect once, then track.
+
+    The full detector only runs every `interval` frames, or as soon as the
+    track is lost. In between, the face rectangles are carried forward by a
+    dlib correlation tracker or from the bounding box of the previous frame's
+    landmarks, so the shape predictor only ever looks inside the tracked rect.
+
+    A correlation track is lost when the tracker's confidence drops below
+    min_confidence, a landmark track when the landmark box overlaps the rect
+    the landmarks were predicted in by less than min_iou.
+    """
+    def __init__(self, detector, interval=_REDETECT_INTERVAL,
+                 mode=TRACK_CORRELATION, min_confidence=_MIN_CONFIDENCE,
+                 min_iou=_MIN_TRACK_IOU):
+        if mode not in TRACK_MODES:
+            raise ValueError("Unknown tracking mode: {}".format(mode))
+
+        self.__detector = detector
+        self.__interval = max(1, interval)
+        self.__mode = mode
+        self.__min_confidence = min_confidence
+        self.__min_iou = min_iou
+
+        self.__rects = []
+        self.__trackers = []
+        self.__since_detect = 0
+
+        self.detections = 0
+
+    def __detect(self, gray, detector=None):
+        detector = detector or self.__detector
+        self.__rects = list(detector(gray, 0))
+        self.__since_detect = 1
+        self.detections += 1
+
+        if self.__mode == TRACK_CORRELATION:
+            self.__trackers = []
+            for rect in self.__rects:
+                tracker = dlib.correlation_tracker()
+                tracker.start_track(gray, rect)
+                self.__trackers.append(tracker)
+
+        return self.__rects
+
+    def __correlate(self, gray):
+        rects = []
+        for tracker in self.__trackers:
+            if tracker.update(gray) < self.__min_confidence:
+                return None
+
+            p = tracker.get_position()
+            rects.append(dlib.rectangle(int(p.left()), int(p.top()),
+                                        int(p.right()), int(p.bottom())))
+
+        return rects
+
+    def rects(self, gray, detector=None):
+        """Face rectangles for the current frame.
+
+        Args:
+            gray: Grayscale frame.
+            detector: Overrides the detector if a detection is due.
+        Returns:
+            List of dlib.rectangle, detected or tracked.
+        """
+        if not self.__rects or self.__since_detect >= self.__interval:
+            return self.__detect(gray, detector)
+
+        if self.__mode == TRACK_CORRELATION:
+            rects = self.__correlate(gray)
+            if rects is None:
+                return self.__detect(gray, detector)
+
+            self.__rects = rects
+
+        self.__since_detect += 1
+
+        return self.__rects
+
+    def retain(self, indices):
+        """Stops tracking every face but the ones at indices of rects()."""
+        self.__rects = [self.__rects[i] for i in indices]
+        if self.__mode == TRACK_CORRELATION:
+            self.__trackers = [self.__trackers[i] for i in indices]
+
+    def follow(self, shapes):
+        """Carries the rects forward from this frame's landmarks.
+
+        Only used in landmark mode. shapes are the landmarks predicted in
+        the retained rects, in order. Landmarks that lost the face drift off
+        it, so their box stops matching the rect they were predicted in; if
+        any track is lost that way, or its landmarks collapse to an empty
+        box, the next frame runs a detection.
+        """
+        if self.__mode != TRACK_LANDMARKS:
+            return
+
+        rects = [landmark_rect(shape) for shape in shapes]
+        lost = any(r.width() <= 1 or r.height() <= 1
+                   or iou(r, prev) < self.__min_iou
+                   for r, prev in zip(rects, self.__rects))
+
+        self.__rects = [] if lost else rects
@@ -1,29 +1,12 @@
 import cv2
 import math
+import time
 import numpy as np
 
-from collections import OrderedDict
-from action  import HeadAction, EyeAction
+from buffers import BufferPool
 
 __DEF_FONT = cv2.FONT_HERSHEY_SIMPLEX
 
-COUNTER_LOG = OrderedDict({
-    HeadAction.LEFT: 0,
-    HeadAction.RIGHT: 0,
-    HeadAction.UP: 0,
-    HeadAction.DOWN: 0,
-    HeadAction.CENTER: 0,
-    HeadAction.ZOOM: 0,
-    HeadAction.UNZOOM: 0,
-    EyeAction.BOTH_OPEN: 0,
-    EyeAction.BOTH_BLINK: 0,
-    EyeAction.BOTH_CLOSED: 0,
-    EyeAction.LEFT_WINK: 0,
-    EyeAction.LEFT_CLOSED: 0,
-    EyeAction.RIGHT_WINK: 0,
-    EyeAction.RIGHT_CLOSED: 0
-})
-
 def midpoint(p1, p2):
     """Midpoint between two points.
 
@@ -72,3 +55,48 @@ def resize_frame(frame):
     left_removed = np.delete(right_removed, range(0, w//4), axis=1)
 
     return cv2.flip(left_removed, 1)
+
+
+class FramePreprocessor():
+    """Zero-copy replacement for resize_frame followed by cvtColor.
+
+    Keeps the middle half of the columns with a view, mirrors it into a
+    pooled BGR buffer and converts that into a pooled grayscale buffer, so
+    the returned arrays are overwritten by the next call.
+    """
+    def __init__(self, pool=None):
+        self.__pool = pool if pool is not None else BufferPool()
+
+    def __call__(self, frame, cropped=False):
+        """
+        Args:
+            frame: Captured BGR frame.
+            cropped: The camera already cropped the frame.
+        Returns:
+            Cropped and mirrored BGR frame and its grayscale version.
+        """
+        _, w, _ = frame.shape
+        crop = frame if cropped else frame[:, w // 4:3 * w // 4]
+
+        image = self.__pool.get("frame", crop.shape, frame.dtype)
+        gray = self.__pool.get("gray", crop.shape[:2], frame.dtype)
+
+        cv2.flip(crop, 1, dst=image)
+        cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=gray)
+
+        return image, gray
+
+
+class RateLimiter():
+    """Lets something through at most once per interval seconds."""
+    def __init__(self, interval=1.0):
+        self.__interval = interval
+        self.__last = None
+
+    def ready(self):
+        now = time.monotonic()
+        if self.__last is not None and now - self.__last < self.__interval:
+            return False
+
+        self.__last = now
+        return True
@@ -0,0 +1,47 @@
+import threading
+
+import cv2
+
+_VIEW_FPS = 30
+
+
+class FrameViewer():
+    """Debug window fed by the capture loop.
+
+    submit() hands over a frame without blocking and a newer frame replaces
+    one that has not been shown yet, so the capture loop never waits on the
+    window. run() owns all HighGUI calls and must run on the main thread,
+    which some platforms require for windows.
+
+    Args:
+        stop: threading.Event; set by a "q" keypress and ends run().
+    """
+    def __init__(self, stop, name="Frame", fps=_VIEW_FPS):
+        self.__stop = stop
+        self.__name = name
+        self.__delay = max(1, int(1000 / fps))
+
+        self.__lock = threading.Lock()
+        self.__frame = None
+
+    def wants_frame(self):
+        """False while the last submitted frame has not been shown yet."""
+        return self.__frame is None
+
+    def submit(self, image):
+        with self.__lock:
+            self.__frame = image
+
+    def run(self):
+        try:
+            while not self.__stop.is_set():
+                with self.__lock:
+                    frame, self.__frame = self.__frame, None
+
+                if frame is not None:
+                    cv2.imshow(self.__name, frame)
+
+                if cv2.waitKey(self.__delay) & 0xFF == ord("q"):
+                    self.__stop.set()
+        finally:
+            cv2.destroyAllWindows()